@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import os
+import signal
+import threading
+import time
+
+import alarmenv
+from apalarm import alarmpi_alarm
+from apcron import cronexpr
+from apregistry import registry
+from aptrace import tracer
+
+# Stays resident and sounds the alarms itself, so the config, the handler
+# modules and their connections are all loaded and ready when it is time.
+# Each config file says when it goes off in [main]:
+#
+#   schedule=33 7 * * 1-5
+#   prepare=5
+#
+# 'prepare' (optional) is how many minutes ahead to build and synthesize
+# the alarm, like 'sound_the_alarm.py --prepare' would.
+class alarmpi_daemon:
+  def __init__(self, configs, debug=False):
+    self.debug = debug
+    self.jobs = []
+    self.stopping = threading.Event()
+    for fn in configs:
+      self.add(fn)
+
+  # Load and check a config file.  Anything wrong is raised right away
+  # rather than when the alarm should be going off.
+  def add(self, fn):
+    AlmEnv = alarmenv.alarmEnv(fn, self.debug)
+    if not os.path.isfile(AlmEnv.ConfigFile):
+      raise IOError('Config file ' + AlmEnv.ConfigFile + ' does not exist')
+    if not AlmEnv.has_option('main', 'schedule'):
+      raise ValueError(AlmEnv.ConfigFile + ' has no schedule in [main]')
+    schedule = cronexpr(AlmEnv.get('main', 'schedule'))
+    # The first alarm's statefldr gets the trace (unless --trace names a file)
+    tracer.place(AlmEnv.getDefault('statefldr'))
+    ahead = 0
+    if AlmEnv.has_option('main', 'prepare'):
+      ahead = int(AlmEnv.get('main', 'prepare'))
+    # Everything imported now, so that no alarm waits for an import
+    alarm = alarmpi_alarm(AlmEnv, eager=True)
+    lead = alarm.lead()
+    job = {
+      'name': AlmEnv.ConfigFile,
+      'alarm': alarm,
+      'schedule': schedule,
+      'ahead': datetime.timedelta(minutes=ahead),
+      'next': schedule.next(datetime.datetime.now()),
+      'prepared': ahead == 0,
+      # Effects that begin before the alarm (a light fading in) do so
+      # 'lead' ahead of it
+      'lead': datetime.timedelta(seconds=lead),
+      'began': lead == 0,
+      # The network is probed in the background this long before the
+      # alarm, so that the answer is there when it goes off
+      'probe': datetime.timedelta(
+        seconds=float(AlmEnv.getDefault('nettimeout'))),
+      'probed': False,
+    }
+    self.jobs.append(job)
+    if self.debug:
+      print job['name'] + ': next alarm at ' + str(job['next'])
+    return job
+
+  # Let effects that take commands (the light's control socket) serve them
+  # while we run.  Alarms naming the same socket are served once.
+  def serve(self):
+    served = set()
+    for job in self.jobs:
+      for name, effect in job['alarm'].sections['effect'].items():
+        path = getattr(effect, 'socket', None)
+        if not path or path in served:
+          continue
+        served.add(path)
+        try:
+          effect.serve()
+          if self.debug:
+            print name + ': listening on ' + path
+        except (IOError, OSError) as e:
+          print name + ': could not listen on ' + path + ': ' + str(e)
+
+  # The things each job still has to do: (when, job, action).  Preparing,
+  # beginning effects early and probing the network don't wait for each
+  # other; firing waits for all of them.
+  def _pending(self):
+    for job in self.jobs:
+      if not job['prepared']:
+        yield (job['next'] - job['ahead'], job, 'prepare')
+      if not job['began']:
+        yield (job['next'] - job['lead'], job, 'early')
+      if not job['probed']:
+        yield (job['next'] - job['probe'], job, 'probe')
+      if job['prepared'] and job['began'] and job['probed']:
+        yield (job['next'], job, 'fire')
+
+  def run(self):
+    while not self.stopping.is_set() and self.jobs:
+      when, job, action = min(self._pending(), key=lambda p: p[0])
+      if not self._sleep_until(when):
+        break
+      at = job['next']
+      if action == 'prepare':
+        job['prepared'] = True
+      elif action == 'early':
+        job['began'] = True
+      elif action == 'probe':
+        job['probed'] = True
+      else:
+        job['next'] = job['schedule'].next(job['next'])
+        job['prepared'] = job['ahead'].total_seconds() == 0
+        job['began'] = job['lead'].total_seconds() == 0
+        job['probed'] = False
+      if self.debug:
+        print str(datetime.datetime.now()) + ' ' + job['name'] + ': ' + action
+      worker = threading.Thread(target=self._run,
+                                args=(job, action, at))
+      worker.daemon = True
+      worker.start()
+
+  def _run(self, job, action, when):
+    alarm = job['alarm']
+    if action == 'early':
+      # Effects start now; the alarm at 'when' carries on with them
+      alarm.early(time.mktime(when.timetuple()))
+      return
+    if action == 'probe':
+      # Returns at once; the alarm asks for the answer when it needs it
+      alarm.testnet()
+      return
+    if action == 'fire' and not job['ahead'].total_seconds():
+      action = 'live'
+    try:
+      tracer.newrun()
+      with tracer.span('run', mode=action, config=job['name']):
+        if action == 'prepare':
+          alarm.testnet()
+        getattr(alarm, action)()
+    except Exception as e:
+      # One bad run must not take the other alarms down with it
+      print job['name'] + ': ' + action + ' failed: ' + repr(e)
+
+  # Wait for a (local, naive) datetime.  Returns False if we were stopped.
+  def _sleep_until(self, when):
+    target = time.mktime(when.timetuple())
+    while not self.stopping.is_set():
+      remaining = target - time.time()
+      if remaining <= 0:
+        return True
+      if remaining > 1:
+        # Wake up early, then finish with a short accurate sleep
+        self.stopping.wait(min(remaining - 0.5, 60))
+      else:
+        time.sleep(remaining)
+    return False
+
+  def stop(self, *args):
+    self.stopping.set()
+
+  # The stop button (SIGUSR1): silence whatever the alarms are doing
+  def silence(self, *args):
+    for job in self.jobs:
+      job['alarm'].stop()
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--debug",
+                      help="output debug info",
+                      action="store_true")
+  parser.add_argument("--config",
+                      help="a config file to schedule (may be repeated)",
+                      action="append")
+  parser.add_argument("--import-profile",
+                      help="report how long each handler takes to import",
+                      action="store_true")
+  parser.add_argument("--trace",
+                      help="append timing spans to TRACE (default "
+                           "trace.jsonl in statefldr)",
+                      nargs='?', const='', default=None)
+  args = parser.parse_args()
+
+  if args.trace is not None:
+    tracer.enable(args.trace)
+
+  registry.profile = args.import_profile
+  daemon = alarmpi_daemon(args.config or [None], args.debug)
+  if args.import_profile:
+    handlers = []
+    for job in daemon.jobs:
+      handlers.extend(job['alarm'].handlers.values())
+    print registry.report(sorted(set(handlers)))
+  signal.signal(signal.SIGTERM, daemon.stop)
+  signal.signal(signal.SIGINT, daemon.stop)
+  signal.signal(signal.SIGUSR1, daemon.silence)
+  daemon.serve()
+  daemon.run()
@@ -3,13 +3,55 @@
 
 import argparse
 import ConfigParser
-import dns.resolver
 import os
 import sys
 
+from apnet import alarmpi_netprobe
+
+# Take command line arguments
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser()
+
+  # Debug can be set in either the config file or in the command line.
+  parser.add_argument("--debug",
+                      help="output debug info",
+                      action="store_true")
+
+  # Use a config file other than the default (allows distinct alarms)
+  parser.add_argument("--config", help="specify the config file")
+
+  # Show what importing each handler module costs
+  parser.add_argument("--import-profile",
+                      help="report how long each handler takes to import",
+                      action="store_true")
+
+  # Write how long each phase takes to a trace file (see aptrace.py)
+  parser.add_argument("--trace",
+                      help="append timing spans to TRACE (default "
+                           "trace.jsonl in statefldr)",
+                      nargs='?', const='', default=None)
+
+  # Split the alarm in two: synthesize the speech a few minutes ahead of
+  # time, then only play it when the alarm goes off.
+  mode = parser.add_mutually_exclusive_group()
+  mode.add_argument("--prepare",
+                    help="build and synthesize the alarm, but don't play it",
+                    action="store_true")
+  mode.add_argument("--fire",
+                    help="play audio made by --prepare (falls back to a "
+                         "normal alarm if there is none)",
+                    action="store_true")
+  # Fill the content cache (see cache_ttl) without sounding the alarm
+  mode.add_argument("--warm",
+                    help="fetch every content section into the cache and "
+                         "exit",
+                    action="store_true")
+
+  return parser.parse_args(argv)
+
 # Class that keeps track of the execution environment
 #   (configuration + system state)
-class alarmEnv:
+class alarmEnv(object):
   defaults = {
     ###################
     # Config defaults #
@@ -19,37 +61,57 @@ class alarmEnv:
     # Default config filename
     'ConfigFile': 'alarm.config',
 
-    # Default host to try to test network connectivity
+    # Default host to try to test network connectivity (several can be
+    # given, separated by commas; any one of them resolving will do)
     'nthost': 'translate.google.com',
-  }
 
-  def __init__(self):
-    # Change to our script directory if we can
-    self.startpath=os.getcwd()
-    stapath = os.path.dirname(sys.argv[0])
-    if stapath:
-      os.chdir(stapath) # When called from cron, we can find our code
+    # Seconds the network test may take before we decide the net is down
+    'nettimeout': 2,
 
-    self.Config=ConfigParser.SafeConfigParser()
+    # Seconds the network test result is good for
+    'netcache': 30,
 
-    # Take command line arguments
-    parser = argparse.ArgumentParser()
+    # Number of content sections that are built at the same time
+    'workers': 4,
 
-    # Debug can be set in either the config file or in the command line.
-    parser.add_argument("--debug",
-                        help="output debug info",
-                        action="store_true")
+    # Where temporary audio goes (keep the trailing '/')
+    'ramfldr': '/mnt/ram/',
+
+    # Audio made by --prepare is ignored by --fire after this many seconds
+    'prepare_maxage': 1800,
+
+    # Seconds from the start of the alarm until we start speaking, no
+    # matter what.  Content that isn't ready by then is left out, or
+    # replaced with what we had last time.
+    'budget': 20,
+
+    # Where sections keep what they need between runs
+    'statefldr': 'state/',
 
-    # Use a config file other than the default (allows distinct alarms)
-    parser.add_argument("--config", help="specify the config file")
+    # Alarms in one process share identical content and speech asked for
+    # within this many seconds of each other
+    'share_window': 60,
+  }
+
+  # Where we were started from, before moving to our script directory
+  startpath = None
+
+  def __init__(self, ConfigFile=None, debug=False):
+    # Change to our script directory if we can
+    if alarmEnv.startpath is None:
+      alarmEnv.startpath=os.getcwd()
+      stapath = os.path.dirname(sys.argv[0])
+      if stapath:
+        os.chdir(stapath) # When called from cron, we can find our code
+    self.startpath = alarmEnv.startpath
 
-    args = parser.parse_args()
+    self.Config=ConfigParser.SafeConfigParser()
 
-    ConfigFile = self._getConfigFileName(args.config)
+    self.ConfigFile = self._getConfigFileName(ConfigFile)
     try:
-      self.Config.read(ConfigFile)
+      self.Config.read(self.ConfigFile)
     except:
-      raise Exception('Sorry, Failed reading config file: ' + ConfigFile)
+      raise Exception('Sorry, Failed reading config file: ' + self.ConfigFile)
 
     # Cheap partial inheritence. Blame Craig.
     self.get = self.Config.get
@@ -58,11 +120,11 @@ class alarmEnv:
     self.items = self.Config.items
 
     # Debug can be set in either the config file or in the command line.
-    self.debug = args.debug or self.hasAndIs('main','debug',1)
-
-    # We still want to alarm if the net is down
-    self._testnet()
+    self.debug = debug or self.hasAndIs('main','debug',1)
 
+    # We still want to alarm if the net is down.  Find out in the
+    # background while everything else gets going.
+    self.testnet()
 
   # get a config file name, resolving relative path if needed
   def _getConfigFileName(self,fname):
@@ -73,23 +135,31 @@ class alarmEnv:
     else:
       return self.defaults['ConfigFile']
 
-  def _getDefault(self,o,s='main'):
+  # get an option, falling back on our defaults if it is not configured
+  def getDefault(self,o,s='main'):
     if self.Config.has_option(s,o):
       return self.Config.get(s,o)
     return self.defaults[o]
   
-  def _testnet(self):
-    # Test for connectivity
-    nthost = self._getDefault('nthost')
-    try:
-      dns.resolver.query(nthost)
-      self.netup=True
-    except:
-      self.netup = False                                                              
-      if self.debug:
-        print('Could not resolve "' +
-              nthost +
-              '". Assuming the network is down.')
+  # Start testing for connectivity; netup has the answer
+  def testnet(self):
+    hosts = [h.strip() for h in self.getDefault('nthost').split(',')]
+    self.probe = alarmpi_netprobe(hosts,
+                                  float(self.getDefault('nettimeout')),
+                                  float(self.getDefault('netcache')),
+                                  self.getDefault('ramfldr'),
+                                  self.debug).start()
+
+  # True if the network is up (waits for the test if it hasn't finished)
+  @property
+  def netup(self):
+    return self.probe.result()
+
+  # The [main] items, including defaults for anything not configured
+  def mainitems(self):
+    items = dict((o, v) for o, v in self.defaults.items() if o != 'ConfigFile')
+    items.update(self.items('main'))
+    return items.items()
 
   # Boolean, returns False unless Config has a Section/Option that
   # matches the value
@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import subprocess
+import threading
+import time
+
+from apeffects import alarmpi_effects
+from apprepare import alarmpi_prepared
+from apregistry import registry
+from aptrace import tracer
+
+# Section types we know how to run
+STYPES = ('content', 'effect', 'tts')
+
+# One alarm: the sections of a config file, loaded once and ready to be
+# run as many times as we like.  TTS engines are only imported when they
+# are first tried, unless eager is set: a resident process (alarm_daemon.py)
+# would rather pay for every import once, at startup, than at fire time.
+class alarmpi_alarm:
+  def __init__(self, AlmEnv, eager=False):
+    self.env = AlmEnv
+    self.debug = AlmEnv.debug
+    self.eager = eager
+
+    # Holds the class instances of each individual section by type
+    self.sections = dict((stype, OrderedDict()) for stype in STYPES)
+    # The handler each section uses
+    self.handlers = OrderedDict()
+    self._load()
+
+    # Audio made ahead of time by prepare(), played by fire()
+    self.prepared = alarmpi_prepared(AlmEnv.getDefault('ramfldr'),
+                                     AlmEnv.ConfigFile,
+                                     int(AlmEnv.getDefault('prepare_maxage')),
+                                     self.debug)
+
+    # Only one run of an alarm at a time
+    self.lock = threading.Lock()
+
+    # The effects of the run under way
+    self.effects = None
+    self.effectslock = threading.Lock()
+
+  def _load(self):
+    AlmEnv = self.env
+    for section in AlmEnv.sections():
+      # We are going to pass only the main and section specific
+      # parts of the configuration to the section modules.  The net state
+      # is added to the main section once we know it (see _shownet).
+      mainitems = AlmEnv.mainitems()
+      if (section != 'main' and
+          AlmEnv.hasAndIs(section, 'enabled', 1)):
+        try:
+          handler = AlmEnv.handler(section)
+          # Section type -- one of 'effect' 'content' 'tts'
+          stype = AlmEnv.stype(section)
+          if stype not in STYPES:
+            raise ValueError('Section ' + section + ' has unknown stype ' +
+                             stype)
+          registry.check(handler, stype)
+          self.handlers[section] = handler
+          # AlmEnv options specific to this section
+          items  = AlmEnv.items(section)
+          if stype == 'tts':
+            # Engines are only imported when we get round to trying them
+            self.sections[stype][section]=registry.lazy(handler,stype,items,
+                                                        self.debug,mainitems)
+            if self.eager:
+              self._touch(section)
+            continue
+          # Get the constructor
+          construct = registry.load(handler)
+          # Construct an instance and put it in out holder
+          self.sections[stype][section]=construct(stype,items,self.debug,
+                                                  mainitems)
+        except ImportError as e:
+          raise ImportError('Failed to load '+section+': '+str(e))
+
+  # Import and construct a lazy engine now.  One that can't be imported
+  # (a library missing) stays lazy, and fails when it is tried, as it
+  # would have anyway.
+  def _touch(self, section):
+    try:
+      self.sections['tts'][section]._load()
+    except ImportError as e:
+      print 'Could not load ' + section + ' yet: ' + str(e)
+
+  # Check the network again (in the background)
+  def testnet(self):
+    self.env.testnet()
+
+  # Let the sections know the net state
+  def _shownet(self, netup):
+    for stype in STYPES:
+      for section in self.sections[stype].values():
+        section.main['netup'] = netup
+
+  # Build all of the content sections at the same time, so that one slow
+  # source doesn't hold up the others.  The parts come out in config order,
+  # each one as soon as it (and every part before it) is ready, followed by
+  # the [main] end phrase.  Whatever the network does, we are done by
+  # [main] budget seconds after start: a section that isn't ready by then
+  # (or by its own deadline) uses its last good content instead.
+  def wad_parts(self, start=None):
+    for name, part in self._named_parts(start):
+      yield part
+
+  # wad_parts(), each part with the name of its section (None for the end
+  # phrase)
+  def _named_parts(self, start=None):
+    if start is None:
+      start = time.time()
+    budget = start + float(self.env.getDefault('budget'))
+    content = self.sections['content']
+    if content:
+      workers = min(int(self.env.getDefault('workers')), len(content))
+      pool = ThreadPool(max(workers, 1))
+      refresh = tracer.carry(self._refresh)
+      builds = []
+      for name, section in content.items():
+        deadline = budget
+        if 'deadline' in section.sconfig:
+          deadline = min(deadline, start + float(section.sconfig['deadline']))
+        builds.append((name, section, deadline,
+                       pool.apply_async(refresh, (name, section, True,
+                                                  deadline))))
+      # Sections that miss their deadline carry on in the background
+      pool.close()
+      # They don't need to know the net state to get going, but we do
+      netup = self.env.netup
+      self._shownet(netup)
+      for name, section, deadline, build in builds:
+        timedout = False
+        try:
+          build.get(max(deadline - time.time(), 0))
+        except TimeoutError:
+          if self.debug:
+            print name + ' missed its deadline.'
+          timedout = True
+        if timedout or section.failed:
+          stale = section.use_stale()
+          tracer.record('stale', time.time(), time.time(), section=name,
+                        timedout=timedout, used=stale)
+          if not stale and timedout:
+            continue # Nothing to say for this one
+        part = self._clean(section.get(netup))
+        if part:
+          yield name, part
+
+    tracer.record('wad', start, time.time())
+    yield None, self._clean(self.env.get('main','end'))
+
+  # All of the parts as a single string
+  def build_wad(self, start=None):
+    wad = '   '.join(self.wad_parts(start))
+
+    if self.debug:
+      print wad
+
+    return wad
+
+  # The engines normalize what they say (quotes and all) themselves
+  def _clean(self, part):
+    return str(part).strip()
+
+  def _refresh(self, name, section, cached=True, deadline=None):
+    with tracer.span('build', section=name) as span:
+      section.refresh(cached, deadline)
+      span.set(failed=section.failed)
+
+  # Seconds before speech that some effect wants to begin (see apeffects)
+  def lead(self):
+    return alarmpi_effects(self.sections['effect']).lead()
+
+  # Begin the effects for speech that starts at 'at', ahead of the alarm
+  # itself (alarm_daemon.py does this 'lead' seconds early).  The run that
+  # follows carries on with them.
+  def early(self, at):
+    with self.effectslock:
+      if self.effects is None:
+        self.effects = alarmpi_effects(self.sections['effect'], self.debug)
+        self.effects.begin(at)
+
+  # Begin all effects (unless early() already has), each on its own
+  def begin_effects(self):
+    with self.effectslock:
+      if self.effects is None:
+        self.effects = alarmpi_effects(self.sections['effect'], self.debug)
+        self.effects.begin()
+
+  # End all effects and wait for them to be over
+  def end_effects(self):
+    with self.effectslock:
+      effects = self.effects
+    if effects is None:
+      return
+    try:
+      effects.end()
+      effects.wait()
+    finally:
+      with self.effectslock:
+        self.effects = None
+
+  # The stop button: whatever the effects are doing (the music playing,
+  # the light fading in) stops now
+  def stop(self):
+    with self.effectslock:
+      effects = self.effects
+    if effects is not None:
+      effects.stop()
+
+  # Try to speak the text
+  def speak(self, wad):
+    self.speak_parts([wad])
+
+  # Speak the parts as they come with the first engine that can.  An engine
+  # that can't say the first piece hands everything over to the next one,
+  # and if none of them can, festival gets it (see _festival).
+  def speak_parts(self, parts):
+    engines = iter(self.sections['tts'].items())
+    said = []
+    stream = None
+    for part in parts:
+      if self.debug:
+        print part
+      said.append(part)
+      if stream is not None and stream[1].feed(part):
+        continue
+      stream = self._takeover(stream, engines, said)
+    while stream is not None and not self._finish(stream):
+      stream = self._takeover(None, engines, said)
+
+    if stream is None: # Nothing worked, so try festival
+      self._festival(said)
+
+  # The last resort: the festival server (started if it isn't running,
+  # see get_festival.py) unless a [festival] section has already been
+  # tried, and then festival on its own
+  def _festival(self, said):
+    text = '   '.join(said)
+    if 'festival' not in [self.handlers[name] for name in self.sections['tts']]:
+      items = []
+      if 'festival' in self.env.sections():
+        items = self.env.items('festival')
+      try:
+        engine = registry.load('festival')('tts', items, self.debug,
+                                           self.env.mainitems())
+        with tracer.span('tts', engine='festival') as span:
+          played = engine.play(text)
+          span.set(played=played)
+        if played:
+          return
+      except Exception as e:
+        print 'festival failed: ' + repr(e)
+    with tracer.span('tts', engine='festival --tts'):
+      # On its stdin rather than through a shell, which would trip over
+      # quotes and the like in the text
+      try:
+        process = subprocess.Popen(['festival', '--tts'],
+                                   stdin=subprocess.PIPE)
+        process.communicate(text)
+        print process.returncode
+      except OSError as e:
+        print 'Could not start festival: ' + str(e)
+
+  # Give up on stream (if it hasn't finished yet) and start the next engine
+  # with everything said so far
+  def _takeover(self, stream, engines, said):
+    if stream is not None:
+      self._finish(stream)
+    ramfldr = self.env.getDefault('ramfldr')
+    for tname, engine in engines:
+      if self.debug:
+        print 'Speaking with ' + tname
+      try:
+        stream = (tname, engine.stream(ramfldr))
+      except Exception as e:
+        # Most likely the engine's module could not be imported
+        print tname + ' failed: ' + repr(e)
+        tracer.record('tts', time.time(), time.time(), engine=tname,
+                      played=False)
+        continue
+      for part in said:
+        stream[1].feed(part)
+      return stream
+    return None
+
+  def _finish(self, stream):
+    tname, tts = stream
+    played = tts.finish()
+    tracer.record('tts', tts.started, time.time(), engine=tname, played=played)
+    if self.debug:
+      print tname + ':' + str(played)
+    return played
+
+  def readaloud(self):
+    return self.env.get('main','readaloud') == str(1)
+
+  # Build every content section now, whatever its cache holds, so that
+  # runs within each section's cache_ttl don't need the network
+  def warm(self):
+    with self.lock:
+      content = self.sections['content']
+      if not content:
+        return
+      workers = min(int(self.env.getDefault('workers')), len(content))
+      pool = ThreadPool(max(workers, 1))
+      builds = [(name, section,
+                 pool.apply_async(tracer.carry(self._refresh),
+                                  (name, section, False)))
+                for name, section in content.items()]
+      pool.close()
+      for name, section, build in builds:
+        build.get()
+        ttl = section.sconfig.get('cache_ttl', '0')
+        print name + ': ' + ('failed' if section.failed else
+                             'cached for ' + ttl + 's' if float(ttl) > 0 else
+                             'ok (no cache_ttl)')
+      pool.join()
+
+  # Build and synthesize the alarm now, for a later fire().  Sections that
+  # depend on the time (see apcontent's clock, e.g. the greeting saying what
+  # time it is) are left for fire() to build and synthesize, so that they
+  # are right when they are heard.
+  def prepare(self):
+    with self.lock:
+      self.prepared.clear()
+      if not self.readaloud():
+        return
+      # Runs of parts that can be made now, and the clock sections between
+      # them
+      segments = []
+      for name, part in self._named_parts():
+        if self.debug:
+          print part
+        if not part:
+          continue
+        if name is not None and self.sections['content'][name].clock:
+          segments.append({'section': name})
+        elif segments and 'text' in segments[-1]:
+          segments[-1]['text'] += '   ' + part
+        else:
+          segments.append({'text': part})
+      try:
+        folder = self.prepared.create()
+      except OSError as e:
+        print 'Could not prepare the alarm: ' + str(e)
+        return
+      for tname in self.sections['tts']:
+        if self.debug:
+          print 'Preparing with ' + tname
+        try:
+          made = self._synthesize(tname, segments, folder)
+        except Exception as e:
+          print tname + ' failed: ' + repr(e)
+          made = None
+        if made:
+          self.prepared.save(tname, made)
+          return
+      if self.debug:
+        print 'No engine could prepare the alarm; fire will run it live.'
+
+  # The segments with their text synthesized into files by tname, or None
+  # if it couldn't do one of them
+  def _synthesize(self, tname, segments, folder):
+    made = []
+    for segment in segments:
+      if 'text' in segment:
+        files = self.sections['tts'][tname].synthesize(segment['text'], folder)
+        if not files:
+          return None
+        segment = {'files': files}
+      made.append(segment)
+    return made
+
+  # Play what prepare() made, if it is still good, with the clock sections
+  # built and synthesized now.  Those are the only work left, and they
+  # don't need the network to be built.
+  def fire(self):
+    ready = self.prepared.load()
+    if ready is None or ready[0] not in self.sections['tts']:
+      return self.live()
+    tname, segments = ready
+    with self.lock:
+      self.begin_effects()
+      try:
+        files = self._clockfiles(tname, segments)
+        played = False
+        if files is not None:
+          with tracer.span('playback', engine=tname, prepared=True):
+            played = self.sections['tts'][tname].playfiles(files)
+        self.prepared.clear()
+        if not played:
+          self.speak(self.build_wad())
+      finally:
+        # Even if speaking failed, or the next run never begins its effects
+        self.end_effects()
+
+  # All of the files to play, in order, the clock sections synthesized
+  # into the prepared folder by tname.  None if one of them couldn't be.
+  def _clockfiles(self, tname, segments):
+    content = self.sections['content']
+    files = []
+    for segment in segments:
+      if 'files' in segment:
+        files.extend(segment['files'])
+        continue
+      name = segment['section']
+      if name not in content:
+        continue
+      self._refresh(name, content[name])
+      part = self._clean(content[name].get(self.env.netup))
+      if not part:
+        continue
+      made = self.sections['tts'][tname].synthesize(part, self.prepared.folder)
+      if not made:
+        return None
+      files.extend(made)
+    return files
+
+  # Do everything at alarm time
+  def live(self):
+    start = time.time()
+    with self.lock:
+      try:
+        if self.readaloud():
+          # Start speaking with the first part instead of waiting for them
+          # all
+          self.begin_effects()
+          self.speak_parts(self.wad_parts(start))
+        else:
+          wad = self.build_wad(start)
+          self.begin_effects()
+          print wad
+      finally:
+        # Even if speaking failed, or the next run never begins its effects
+        self.end_effects()
@@ -1,14 +1,35 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import copy
+import json
+import threading
+import time
+
+import aphttp
+import better_spoken_numbers as bsn
 from apsection import alarmpi_section
+from apshare import alarmpi_shared
+from apstore import alarmpi_store
+
+# Content builds shared by the alarms in this process
+builds = alarmpi_shared()
 
+# Guards handing a build's result to its section against use_stale()
+_lock = threading.Lock()
+
+# The caller runs refresh() (possibly in a worker pool, alongside the other
+# sections) before asking for the content with get().
 class alarmpi_content(alarmpi_section):
-  def __init__(self, stype, sconfig, debug, main):
-    alarmpi_section.__init__(self, stype, sconfig, debug, main)
-    self.build()
+  # build() sets this when it could only come up with a failure message
+  failed = False
+  # True when content is what we had from an earlier run
+  stale = False
+  # Bumped by every refresh() and use_stale(), so that a build we gave up
+  # on can't overwrite what we use instead when it finally finishes
+  run = 0
 
   def get(self, netup):
-    if(self.main['netup']):
+    if netup:
       if self.standalone() < 2:
         return self._get()
       else:
@@ -26,3 +47,116 @@ class alarmpi_content(alarmpi_section):
 
   def build(self):
     self.content='Instance of ' + self.stype + ' class.'
+
+  # build(), remembering the content if it worked so that it can stand in
+  # for a later build that fails or runs out of time.  Content saved less
+  # than the section's cache_ttl seconds ago is used without building at
+  # all, unless cached is False.  Alarms in the same process with a
+  # section like this one (same handler, same options) share one build if
+  # they ask within [main] share_window seconds (and wait for another
+  # alarm's build no later than deadline).  The build runs on a copy of the
+  # section, which only becomes its content if we are still waiting for it.
+  def refresh(self, cached=True, deadline=None):
+    with _lock:
+      self.run += 1
+      run = self.run
+    window = float(self.main.get('share_window', 60))
+    content, failed, built = builds.get(
+      self._sharekey() + (cached,), window,
+      lambda: copy.copy(self)._build(cached), deadline=deadline)
+    if built and not failed:
+      # Even a late build is good for next time
+      self._store().save(self._storename(), {
+        'time': time.time(),
+        'content': content,
+      })
+    with _lock:
+      if run == self.run:
+        self.content, self.failed, self.stale = content, failed, False
+
+  # Returns (content, failed, whether it was built just now)
+  def _build(self, cached):
+    if cached:
+      content = self._cached()
+      if content is not None:
+        if self.debug:
+          print self.stype + ' content from the cache'
+        return content, False, False
+    self.failed = False
+    try:
+      self.build()
+    except Exception as e:
+      if self.debug:
+        print self.stype + ' build failed: ' + repr(e)
+      self.failed = True
+      self.content = ''
+    return self.content, self.failed, True
+
+  # What we saved less than cache_ttl seconds ago, or None
+  def _cached(self):
+    ttl = float(self.sconfig.get('cache_ttl', 0))
+    if ttl <= 0:
+      return None
+    saved = self._store().load(self._storename())
+    if saved is None or not 0 <= time.time() - saved['time'] < ttl:
+      return None
+    if self.clock and time.strftime(self.clock) != \
+       time.strftime(self.clock, time.localtime(saved['time'])):
+      return None
+    content = saved['content']
+    if isinstance(content, unicode):
+      content = content.encode('utf-8')
+    return content
+
+  # Content that depends on the time (the greeting says what time it is)
+  # is only shared with alarms asking while this strftime format of the
+  # time is the same
+  clock = None
+
+  def _sharekey(self):
+    key = (self.__class__.__module__, self.__class__.__name__,
+           tuple(sorted(self.sconfig.items())))
+    if self.clock:
+      key += (time.strftime(self.clock),)
+    return key
+
+  # Use the last good content instead of whatever build() did (or is still
+  # doing).  Returns False if we never had any.
+  def use_stale(self):
+    saved = self._store().load(self._storename())
+    if saved is None:
+      return False
+    content = saved['content']
+    if isinstance(content, unicode):
+      content = content.encode('utf-8')
+    when = time.localtime(saved['time'])
+    since = time.strftime('%A ', when) + bsn.clock(when.tm_hour, when.tm_min)
+    with _lock:
+      self.run += 1
+      self.content = 'Not updated since ' + since + '.  ' + content
+      self.stale = True
+    return True
+
+  def _store(self):
+    return alarmpi_store.from_main(self.main, self.debug)
+
+  def _storename(self):
+    return 'content-' + alarmpi_store.key(self.__class__.__name__,
+                                          sorted(self.sconfig.items()))
+
+  # Fetch url through the shared HTTP client, using this section's
+  # connect_timeout, read_timeout and retries options if it has them.
+  # Returns an aphttp.httpresponse.
+  def request(self, url, **kwargs):
+    for option in ('connect_timeout', 'read_timeout', 'retries'):
+      if option in self.sconfig and option not in kwargs:
+        kwargs[option] = self.sconfig[option]
+    return aphttp.client.request(url, **kwargs)
+
+  # The body of url, as a string
+  def fetch(self, url, **kwargs):
+    return self.request(url, **kwargs).body
+
+  # The body of url, decoded from JSON
+  def fetchjson(self, url, **kwargs):
+    return json.loads(self.fetch(url, **kwargs))
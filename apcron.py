@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import datetime
+
+# A crontab style schedule: "minute hour day-of-month month day-of-week".
+# Each field takes '*', numbers, ranges (1-5), lists (1,3,5) and steps
+# (*/15 or 0-30/10).  Day of week runs 0-7 with both 0 and 7 being Sunday.
+# As in cron, if both day fields are restricted a day matching either runs.
+class cronexpr:
+  fields = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7),
+  )
+
+  def __init__(self, expr):
+    self.expr = expr
+    parts = expr.split()
+    if len(parts) != len(self.fields):
+      raise ValueError('Schedule "' + expr + '" needs ' +
+                       str(len(self.fields)) + ' fields')
+    for part, (name, lo, hi) in zip(parts, self.fields):
+      setattr(self, name, self._parse(part, name, lo, hi))
+    if 7 in self.weekday:
+      self.weekday = (self.weekday - set([7])) | set([0])
+    self.anyday = parts[2] == '*'
+    self.anyweekday = parts[4] == '*'
+
+  def _parse(self, part, name, lo, hi):
+    values = set()
+    for item in part.split(','):
+      step = 1
+      if '/' in item:
+        item, step = item.split('/', 1)
+        step = int(step)
+      if item == '*':
+        first, last = lo, hi
+      elif '-' in item:
+        first, last = [int(x) for x in item.split('-', 1)]
+      else:
+        first = last = int(item)
+        if step != 1:
+          last = hi
+      if first < lo or last > hi or first > last or step < 1:
+        raise ValueError('Bad ' + name + ' "' + part + '" in schedule "' +
+                         self.expr + '"')
+      values.update(range(first, last + 1, step))
+    return values
+
+  def _dayok(self, when):
+    # datetime has Monday as 0, cron has Sunday as 0
+    weekday = (when.weekday() + 1) % 7
+    if self.anyday:
+      return self.anyweekday or weekday in self.weekday
+    if self.anyweekday:
+      return when.day in self.day
+    return when.day in self.day or weekday in self.weekday
+
+  def matches(self, when):
+    return (when.minute in self.minute and
+            when.hour in self.hour and
+            when.month in self.month and
+            self._dayok(when))
+
+  # The first time after 'after' (a naive local datetime) that matches
+  def next(self, after):
+    when = after.replace(second=0, microsecond=0) + \
+           datetime.timedelta(minutes=1)
+    # A matching day can't be more than a few years away
+    limit = when + datetime.timedelta(days=366 * 5)
+    while when < limit:
+      if when.month not in self.month:
+        year = when.year + when.month // 12
+        when = when.replace(year=year, month=when.month % 12 + 1, day=1,
+                            hour=0, minute=0)
+      elif not self._dayok(when):
+        when = when.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+      elif when.hour not in self.hour:
+        when = when.replace(minute=0) + datetime.timedelta(hours=1)
+      elif when.minute not in self.minute:
+        when += datetime.timedelta(minutes=1)
+      else:
+        return when
+    raise ValueError('Schedule "' + self.expr + '" never runs')
@@ -11,3 +11,7 @@ class alarmpi_effect(alarmpi_section):
   # Do this at the end of the alarm
   def end(self):
     print 'Instance of ' + self.stype + ' class end method.'
+
+  # Stop whatever begin() or end() started, right now (the stop button)
+  def stop(self):
+    pass
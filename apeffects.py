@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from aptrace import tracer
+
+# Runs the begin() and end() of an alarm's effects, each on a thread of its
+# own, so that one effect never waits for another unless it says so.  Any
+# effect section can have:
+#
+#   after=light,music  its begin() waits for their begin(), and its end()
+#                      for their end()
+#   begin_offset=-600  seconds from when speech starts to begin() (before
+#                      it if negative: the light starts fading in 10
+#                      minutes early)
+#   end_offset=30      seconds from when speech ends to end()
+#
+# A begin() always finishes before the end() of the same effect starts.
+# stop() cancels everything still to come and calls every effect's stop().
+class alarmpi_effects:
+  def __init__(self, effects, debug=False):
+    self.effects = effects # {name: effect}, in config order
+    self.debug = debug
+    self.after = {}
+    for name, effect in effects.items():
+      after = [a.strip() for a in
+               effect.sconfig.get('after', '').split(',') if a.strip()]
+      # Effects that aren't enabled don't hold anyone up
+      self.after[name] = [a for a in after if a in effects]
+    self._check()
+    self.cancelled = threading.Event()
+    # (phase, name) -> set when that hook is over (or won't happen)
+    self.done = dict(((phase, name), threading.Event())
+                     for phase in ('begin', 'end') for name in effects)
+    self.threads = []
+
+  def _check(self):
+    state = {}
+    def visit(name, path):
+      if state.get(name) == 'done':
+        return
+      if state.get(name) == 'visiting':
+        raise ValueError('Effects wait for each other: ' +
+                         ' -> '.join(path + [name]))
+      state[name] = 'visiting'
+      for other in self.after[name]:
+        visit(other, path + [name])
+      state[name] = 'done'
+    for name in self.effects:
+      visit(name, [])
+
+  def _offset(self, name, option, default):
+    return float(self.effects[name].sconfig.get(option, default))
+
+  # How many seconds before speech the earliest begin() wants to run
+  def lead(self):
+    return max([0] + [-self._offset(name, 'begin_offset', 0)
+                      for name in self.effects])
+
+  # Start the begin() of every effect, for speech starting at 'at' (now if
+  # None).  Returns at once.
+  def begin(self, at=None):
+    at = time.time() if at is None else at
+    for name in self.effects:
+      self._spawn('begin', name, at + self._offset(name, 'begin_offset', 0))
+
+  # Start the end() of every effect, for speech that ended at 'at' (now if
+  # None).  Returns at once.
+  def end(self, at=None):
+    at = time.time() if at is None else at
+    for name in self.effects:
+      self._spawn('end', name, at + self._offset(name, 'end_offset', 0))
+
+  # Wait until every hook started so far is over, or we are stopped.
+  # Returns False if we were stopped.
+  def wait(self):
+    for thread in self.threads:
+      # A timeout, so that a signal (the stop button) gets through
+      while thread.is_alive():
+        thread.join(1)
+    return not self.cancelled.is_set()
+
+  # Cancel the hooks still to come and stop the effects where they are
+  def stop(self):
+    self.cancelled.set()
+    for name, effect in self.effects.items():
+      try:
+        effect.stop()
+      except Exception as e:
+        print 'Could not stop ' + name + ': ' + repr(e)
+
+  def _spawn(self, phase, name, when):
+    thread = threading.Thread(target=tracer.carry(self._run),
+                              args=(phase, name, when),
+                              name='effect-' + phase + '-' + name)
+    thread.daemon = True
+    self.threads.append(thread)
+    thread.start()
+
+  def _run(self, phase, name, when):
+    try:
+      waits = [('begin', name)] if phase == 'end' else []
+      waits.extend((phase, other) for other in self.after[name])
+      for key in waits:
+        self.done[key].wait()
+      delay = when - time.time()
+      if delay > 0 and self.cancelled.wait(delay):
+        return
+      if self.cancelled.is_set():
+        return
+      if self.debug:
+        print name + ' ' + phase
+      with tracer.span('effect.' + phase, effect=name):
+        getattr(self.effects[name], phase)()
+    except Exception as e:
+      # One broken effect must not take the others (or the alarm) down
+      print name + ' ' + phase + ' failed: ' + repr(e)
+    finally:
+      self.done[(phase, name)].set()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import httplib
+import random
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+# Raised for responses we can't use (after any retries)
+class HTTPError(IOError):
+  def __init__(self, url, status, reason=''):
+    IOError.__init__(self, 'HTTP ' + str(status) + ' ' + reason + ' for ' + url)
+    self.url = url
+    self.status = status
+
+class httpresponse:
+  def __init__(self, url, status, headers, body):
+    self.url = url
+    self.status = status
+    # Header names are lower case
+    self.headers = headers
+    self.body = body
+
+  def getheader(self, name, default=None):
+    return self.headers.get(name.lower(), default)
+
+# One HTTP client shared by all of the content sources.  Connections are
+# pooled per host and kept alive between requests, every request gets a
+# connect and a read timeout, failures are retried a few times with
+# jittered backoff, and responses may be gzipped.
+class alarmpi_http:
+  defaults = {
+    # Seconds to wait for a connection / for the server to answer
+    'connect_timeout': 3.0,
+    'read_timeout': 5.0,
+
+    # Extra attempts after the first one fails
+    'retries': 2,
+
+    # First backoff in seconds; doubles with each retry, plus jitter
+    'backoff': 0.25,
+  }
+
+  # Idle connections older than this are not reused
+  keepalive = 30
+  redirects = 5
+  useragent = 'alarmpi'
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    # (scheme, host, port) -> [(connection, time it went idle)]
+    self.idle = {}
+
+  # Fetch url and return an httpresponse.  Statuses in 'accept' are
+  # returned as they are, anything else that isn't a 2xx raises HTTPError.
+  def request(self, url, headers=None, connect_timeout=None, read_timeout=None,
+              retries=None, backoff=None, accept=()):
+    connect_timeout = self._option(connect_timeout, 'connect_timeout', float)
+    read_timeout = self._option(read_timeout, 'read_timeout', float)
+    retries = self._option(retries, 'retries', int)
+    backoff = self._option(backoff, 'backoff', float)
+
+    attempt = 0
+    while True:
+      try:
+        return self._follow(url, headers or {}, connect_timeout,
+                            read_timeout, accept)
+      except (IOError, httplib.HTTPException, socket.error) as e:
+        retry = not isinstance(e, HTTPError) or e.status >= 500
+        if not retry or attempt >= retries:
+          raise
+      attempt += 1
+      time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+  # The body of url, as a string
+  def get(self, url, **kwargs):
+    return self.request(url, **kwargs).body
+
+  def _option(self, value, name, cast):
+    if value is None:
+      value = self.defaults[name]
+    return cast(value)
+
+  def _follow(self, url, headers, connect_timeout, read_timeout, accept):
+    for hop in range(self.redirects + 1):
+      response = self._once(url, headers, connect_timeout, read_timeout)
+      location = response.getheader('location')
+      if response.status in (301, 302, 303, 307, 308) and location:
+        url = urlparse.urljoin(url, location)
+        continue
+      if response.status in accept or 200 <= response.status < 300:
+        return response
+      raise HTTPError(url, response.status)
+    raise HTTPError(url, response.status, 'too many redirects')
+
+  def _once(self, url, headers, connect_timeout, read_timeout):
+    parts = urlparse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https'):
+      raise ValueError('Unsupported url ' + url)
+    key = (scheme, parts.hostname, parts.port)
+    path = parts.path or '/'
+    if parts.query:
+      path += '?' + parts.query
+
+    send = {
+      'Accept-Encoding': 'gzip',
+      'User-Agent': self.useragent,
+    }
+    send.update(headers)
+
+    conn, reused = self._checkout(key, connect_timeout, read_timeout)
+    try:
+      try:
+        conn.request('GET', path, headers=send)
+        response = conn.getresponse()
+      except (httplib.HTTPException, socket.error):
+        if not reused:
+          raise
+        # The server closed our kept-alive connection; try a fresh one
+        conn.close()
+        conn, reused = self._connect(key, connect_timeout, read_timeout), False
+        conn.request('GET', path, headers=send)
+        response = conn.getresponse()
+      body = response.read()
+    except:
+      conn.close()
+      raise
+
+    headers = dict((k.lower(), v) for k, v in response.getheaders())
+    if headers.get('content-encoding') == 'gzip':
+      body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+    if response.will_close:
+      conn.close()
+    else:
+      self._checkin(key, conn)
+    return httpresponse(url, response.status, headers, body)
+
+  # An idle connection to key if we have one, or a new one
+  def _checkout(self, key, connect_timeout, read_timeout):
+    now = time.time()
+    with self.lock:
+      pool = self.idle.get(key, [])
+      while pool:
+        conn, since = pool.pop()
+        if now - since < self.keepalive and conn.sock is not None:
+          conn.sock.settimeout(read_timeout)
+          return conn, True
+        conn.close()
+    return self._connect(key, connect_timeout, read_timeout), False
+
+  def _connect(self, key, connect_timeout, read_timeout):
+    scheme, host, port = key
+    if scheme == 'https':
+      conn = httplib.HTTPSConnection(host, port, timeout=connect_timeout)
+    else:
+      conn = httplib.HTTPConnection(host, port, timeout=connect_timeout)
+    conn.connect()
+    conn.sock.settimeout(read_timeout)
+    return conn
+
+  def _checkin(self, key, conn):
+    with self.lock:
+      self.idle.setdefault(key, []).append((conn, time.time()))
+
+  # Close every idle connection
+  def close(self):
+    with self.lock:
+      for pool in self.idle.values():
+        for conn, since in pool:
+          conn.close()
+      self.idle = {}
+
+# The client everybody shares
+client = alarmpi_http()
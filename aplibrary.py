@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import ConfigParser
+import os
+import random
+import sqlite3
+import time
+
+from apstore import alarmpi_store
+
+try:
+  import mutagen
+except ImportError:
+  mutagen = None # Without it tracks are indexed without their tags
+
+# Tags that can be filtered on, besides the path
+TAGS = ('artist', 'album', 'genre', 'title')
+
+# Tracks pick() looks up per query (sqlite takes up to 999 parameters)
+BATCH = 500
+
+# A persistent index of the tracks under a music folder, in sqlite, so that
+# an alarm doesn't have to walk a whole (maybe networked) library to pick
+# a few songs.
+#
+# update() only lists the folders whose mtime changed since the last time
+# (adding or removing a file or folder changes it); the rest cost a stat
+# each.  Tracks are numbered 1..count with no gaps (a removed track's
+# number goes to the last one), so a random track is a random number and
+# one lookup, whatever the size of the library.
+class alarmpi_library:
+  def __init__(self, dbfile, root, tail='.mp3', debug=False):
+    self.dbfile = dbfile
+    self.root = os.path.abspath(root)
+    self.tails = tuple(t.strip().lower() for t in tail.split(',') if t.strip())
+    self.debug = debug
+
+  # The index for root kept in statefldr, unless sconfig names a file
+  @classmethod
+  def from_config(cls, sconfig, main, debug=False):
+    root = sconfig['musicfldr']
+    dbfile = sconfig.get('library')
+    if not dbfile:
+      dbfile = os.path.join(main.get('statefldr', 'state/'),
+                            'music-' + alarmpi_store.key(root)[:12] + '.db')
+    return cls(dbfile, root, sconfig.get('tail', '.mp3'), debug)
+
+  # The [music] index of a config file, brought up to date if it is older
+  # than 'rescan' seconds: for the play_a_* scripts
+  @classmethod
+  def for_scripts(cls, configfile='alarm.config', debug=False):
+    Config = ConfigParser.ConfigParser()
+    if not Config.read(configfile):
+      raise IOError('Sorry, Failed reading ' + configfile + ' file.')
+    section = dict(Config.items('music')) if Config.has_section('music') else {}
+    if 'musicfldr' not in section:
+      section['musicfldr'] = Config.get('main', 'musicfldr')
+    library = cls.from_config(section, dict(Config.items('main')), debug)
+    library.refresh(float(section.get('rescan', 3600)))
+    return library
+
+  # update() if the last one was more than rescan seconds ago
+  def refresh(self, rescan):
+    age = self.age()
+    if age is None or age > rescan:
+      return self.update()
+    return 0
+
+  # A connection of our own (sqlite connections can't move between threads)
+  def _connect(self):
+    folder = os.path.dirname(self.dbfile)
+    if folder and not os.path.isdir(folder):
+      os.makedirs(folder)
+    db = sqlite3.connect(self.dbfile)
+    db.text_factory = str
+    db.executescript('''
+      CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value);
+      CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT,
+                                       mtime REAL);
+      CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+      CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY,
+                                         path TEXT UNIQUE, dir TEXT,
+                                         artist TEXT, album TEXT,
+                                         genre TEXT, title TEXT);
+      CREATE INDEX IF NOT EXISTS tracks_dir ON tracks (dir);
+    ''')
+    return db
+
+  def _info(self, db, name, value=None):
+    if value is not None:
+      db.execute('INSERT OR REPLACE INTO info VALUES (?, ?)', (name, value))
+      return value
+    row = db.execute('SELECT value FROM info WHERE name = ?',
+                     (name,)).fetchone()
+    return row[0] if row else None
+
+  # Seconds since the last update(), or None if there hasn't been one
+  def age(self):
+    db = self._connect()
+    try:
+      if self._info(db, 'root') != self.root:
+        return None
+      scanned = self._info(db, 'scanned')
+      return time.time() - scanned if scanned is not None else None
+    finally:
+      db.close()
+
+  # Bring the index up to date with the folder.  Returns the number of
+  # folders that had to be listed.
+  def update(self):
+    db = self._connect()
+    try:
+      if self._info(db, 'root') != self.root:
+        # A different library: start again
+        db.execute('DELETE FROM dirs')
+        db.execute('DELETE FROM tracks')
+        self._info(db, 'root', self.root)
+      listed = 0
+      stack = [self.root]
+      while stack:
+        folder = stack.pop()
+        try:
+          mtime = os.stat(folder).st_mtime
+        except OSError:
+          continue # Gone; listing its parent forgets it
+        row = db.execute('SELECT mtime FROM dirs WHERE path = ?',
+                         (folder,)).fetchone()
+        if row and row[0] == mtime:
+          stack.extend(r[0] for r in db.execute(
+            'SELECT path FROM dirs WHERE parent = ?', (folder,)))
+          continue
+        try:
+          names = os.listdir(folder)
+        except OSError as e:
+          if self.debug:
+            print 'Could not list ' + folder + ': ' + str(e)
+          continue
+        subdirs = self._list(db, folder, names)
+        parent = None if folder == self.root else os.path.dirname(folder)
+        db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                   (folder, parent, mtime))
+        stack.extend(subdirs)
+        listed += 1
+        if listed % 100 == 0:
+          db.commit() # Don't lose a long first scan if we are stopped
+      self._info(db, 'scanned', time.time())
+      db.commit()
+      if self.debug:
+        print 'Music index: listed ' + str(listed) + ' folders, ' + \
+              str(self._count(db)) + ' tracks'
+      return listed
+    finally:
+      db.close()
+
+  # Make the index match what is in folder.  Returns its subfolders.
+  def _list(self, db, folder, names):
+    subdirs = []
+    tracks = set()
+    for name in names:
+      path = os.path.join(folder, name)
+      if os.path.isdir(path):
+        subdirs.append(path)
+      elif name.lower().endswith(self.tails):
+        tracks.add(path)
+
+    known = dict(db.execute('SELECT path, id FROM tracks WHERE dir = ?',
+                            (folder,)))
+    for path in set(known) - tracks:
+      self._remove(db, path)
+    for path in sorted(tracks - set(known)):
+      tags = self._tags(path)
+      db.execute('INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 [self._count(db) + 1, path, folder] +
+                 [tags.get(t) for t in TAGS])
+
+    # New folders are listed even if we are stopped before we get to them,
+    # because they have no mtime yet
+    known = set(r[0] for r in db.execute(
+      'SELECT path FROM dirs WHERE parent = ?', (folder,)))
+    for path in known - set(subdirs):
+      self._forget(db, path)
+    for path in set(subdirs) - known:
+      db.execute('INSERT INTO dirs VALUES (?, ?, NULL)', (path, folder))
+    return subdirs
+
+  def _count(self, db):
+    return db.execute('SELECT max(id) FROM tracks').fetchone()[0] or 0
+
+  # Remove a track and give its number to the last one, to keep no gaps
+  def _remove(self, db, path):
+    row = db.execute('SELECT id FROM tracks WHERE path = ?', (path,)).fetchone()
+    if row is None:
+      return
+    last = self._count(db)
+    db.execute('DELETE FROM tracks WHERE id = ?', row)
+    if row[0] != last:
+      db.execute('UPDATE tracks SET id = ? WHERE id = ?', (row[0], last))
+
+  # Forget a folder that is gone, and everything that was in it
+  def _forget(self, db, folder):
+    prefix = folder + os.sep
+    inside = 'path = ? OR substr(path, 1, ?) = ?'
+    for row in db.execute('SELECT path FROM tracks WHERE dir = ? OR '
+                          'substr(dir, 1, ?) = ?',
+                          (folder, len(prefix), prefix)).fetchall():
+      self._remove(db, row[0])
+    db.execute('DELETE FROM dirs WHERE ' + inside,
+               (folder, len(prefix), prefix))
+
+  # {tag: value} for the tags of a track we can read
+  def _tags(self, path):
+    if mutagen is None:
+      return {}
+    try:
+      audio = mutagen.File(path, easy=True)
+    except Exception:
+      return {}
+    if not audio or not audio.tags:
+      return {}
+    tags = {}
+    for tag in TAGS:
+      values = audio.tags.get(tag)
+      if values:
+        value = values[0]
+        tags[tag] = value.encode('utf-8') if isinstance(value, unicode) \
+                    else value
+    return tags
+
+  # Up to n tracks (all of them if n is 0 or None) in a random order, none
+  # twice.  filters is {tag or 'path': text}; a track matches if every tag
+  # contains its text (ignoring case).
+  def pick(self, n=None, filters=None):
+    filters = dict((k, v) for k, v in (filters or {}).items() if v)
+    for tag in filters:
+      if tag != 'path' and tag not in TAGS:
+        raise ValueError('Can\'t filter music on ' + tag)
+    db = self._connect()
+    try:
+      if filters:
+        # Only the numbers of the tracks that match
+        where = ' AND '.join(tag + ' LIKE ?' for tag in filters)
+        ids = [r[0] for r in db.execute(
+          'SELECT id FROM tracks WHERE ' + where,
+          ['%' + v + '%' for v in filters.values()])]
+      else:
+        ids = xrange(1, self._count(db) + 1)
+      if not n or n > len(ids):
+        n = len(ids)
+      picked = random.sample(ids, n)
+      # Looked up BATCH at a time (all of a big library would otherwise
+      # be a query per track), then put back in the order we picked them
+      paths = {}
+      for start in xrange(0, len(picked), BATCH):
+        batch = picked[start:start + BATCH]
+        paths.update(db.execute(
+          'SELECT id, path FROM tracks WHERE id IN (' +
+          ','.join('?' * len(batch)) + ')', batch))
+      return [paths[i] for i in picked if i in paths]
+    finally:
+      db.close()
+
+  # One random track, or None if there are none
+  def choice(self, filters=None):
+    tracks = self.pick(1, filters)
+    return tracks[0] if tracks else None
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import atexit
+import os
+import socket
+import SocketServer
+import threading
+import time
+
+# Where alarm_daemon.py listens for light commands: 'socket' in [light], or
+# light.sock in [main] statefldr.  Not /tmp, where anyone could put a
+# socket of their own in its place.
+def socketpath(sconfig, main):
+  if 'socket' in sconfig:
+    return sconfig['socket']
+  return os.path.join(main.get('statefldr', 'state/'), 'light.sock')
+
+# Drives the pins through RPi.GPIO, which is imported and set up the first
+# time a pin is used.  Without it (not a Pi, library missing) the light
+# says so once and does nothing: the alarm goes on without it.  Full on and
+# off are plain high and low, so they stay put after we exit; anything in
+# between is software PWM, which needs us running.
+class alarmpi_gpiopins:
+  def __init__(self, frequency=200, debug=False):
+    self.GPIO = None
+    self.failed = False
+    self.frequency = frequency
+    self.debug = debug
+    self.ready = set()
+    self.pwm = {}
+
+  # Set a pin to a brightness between 0 and 1
+  def level(self, pin, value):
+    GPIO = self._gpio()
+    if GPIO is None:
+      return
+    if pin not in self.ready:
+      GPIO.setup(pin, GPIO.OUT)
+      self.ready.add(pin)
+    if value <= 0 or value >= 1:
+      if pin in self.pwm:
+        self.pwm.pop(pin).stop()
+      GPIO.output(pin, GPIO.HIGH if value >= 1 else GPIO.LOW)
+    elif pin in self.pwm:
+      self.pwm[pin].ChangeDutyCycle(value * 100)
+    else:
+      self.pwm[pin] = GPIO.PWM(pin, self.frequency)
+      self.pwm[pin].start(value * 100)
+
+  # RPi.GPIO, or None if it can't be had.  Called with the light's lock
+  # held.
+  def _gpio(self):
+    if self.GPIO is None and not self.failed:
+      try:
+        import RPi.GPIO as GPIO
+        # Use BCM GPIO references instead of physical pin numbers
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        self.GPIO = GPIO
+      except (ImportError, RuntimeError) as e:
+        # RuntimeError: not a Pi, or no access to its GPIO
+        print 'The light will stay off: ' + str(e)
+        self.failed = True
+    return self.GPIO
+
+# Pins that only remember their level, to run the light anywhere.  With a
+# log file every change is appended to it as '<time> <pin> <level>'.
+class alarmpi_mockpins:
+  def __init__(self, log=None, debug=False):
+    self.log = log
+    self.debug = debug
+    self.levels = {}
+
+  def level(self, pin, value):
+    self.levels[pin] = value
+    if self.debug:
+      print 'Light pin ' + str(pin) + ' at ' + str(value)
+    if self.log:
+      with open(self.log, 'a') as f:
+        f.write('%f %d %g\n' % (time.time(), pin, value))
+
+# A light on one or more pins.  Everything that takes time (a sunrise ramp,
+# turning off later) happens on a thread of its own, and whatever the light
+# was doing is cancelled by the next thing it is asked to do.
+class alarmpi_light:
+  def __init__(self, pins, backend):
+    self.pins = pins
+    self.backend = backend
+    self.lock = threading.Lock()
+    self.value = 0
+    # Bumped by every request, so that an old ramp or timer knows to give up
+    self.generation = 0
+    self.cancelled = threading.Event()
+    self.thread = None
+
+  def level(self, value):
+    with self.lock:
+      self._cancel()
+      self._set(value)
+
+  def on(self):
+    self.level(1)
+
+  def off(self):
+    self.level(0)
+
+  # Fade from where we are to full on over some seconds, like a sunrise:
+  # brightness goes up slowly at first, as the eye sees it.  Returns at once.
+  def ramp(self, seconds, steps=100):
+    with self.lock:
+      self._cancel()
+      self._spawn(self._ramp, self.value, float(seconds), steps)
+
+  # Turn off after some seconds.  Returns at once.
+  def off_after(self, seconds):
+    with self.lock:
+      self._cancel()
+      self._spawn(self._later, float(seconds), 0)
+
+  # Wait until any ramp or timer is over (the light is stopped if we are
+  # killed before then)
+  def wait(self):
+    thread = self.thread
+    if thread is not None:
+      thread.join()
+
+  # Called with the lock held
+  def _set(self, value):
+    self.value = max(0.0, min(1.0, value))
+    for pin in self.pins:
+      self.backend.level(pin, self.value)
+
+  def _cancel(self):
+    self.generation += 1
+    self.cancelled.set()
+    self.cancelled = threading.Event()
+
+  # Called with the lock held
+  def _spawn(self, target, *args):
+    args = (self.generation, self.cancelled) + args
+    # Not a daemon (even if we are called from one): a one-shot alarm stays
+    # up until the light is done
+    self.thread = threading.Thread(target=target, args=args, name='light')
+    self.thread.daemon = False
+    self.thread.start()
+
+  def _step(self, generation, value):
+    with self.lock:
+      if generation != self.generation:
+        return False
+      self._set(value)
+      return True
+
+  def _ramp(self, generation, cancelled, start, seconds, steps):
+    for step in range(1, steps + 1):
+      if cancelled.wait(seconds / steps):
+        return
+      done = float(step) / steps
+      if not self._step(generation, start + (1 - start) * done * done):
+        return
+
+  def _later(self, generation, cancelled, seconds, value):
+    if not cancelled.wait(seconds):
+      self._step(generation, value)
+
+# The light of a [light] section (or of its items in a dict).  Lights are
+# shared by everything in the process that names the same pins.
+_lights = {}
+_lock = threading.Lock()
+
+def light(sconfig, debug=False):
+  pins = tuple(int(p) for p in str(sconfig.get('pins', '15')).split(','))
+  backend = sconfig.get('backend', 'gpio').strip()
+  with _lock:
+    if pins not in _lights:
+      if backend == 'mock':
+        pinset = alarmpi_mockpins(sconfig.get('mocklog'), debug)
+      elif backend == 'gpio':
+        pinset = alarmpi_gpiopins(int(sconfig.get('frequency', 200)), debug)
+      else:
+        raise ValueError('Unknown light backend ' + backend)
+      _lights[pins] = alarmpi_light(pins, pinset)
+    return _lights[pins]
+
+# Control socket: one command per connection, answered with 'ok' or
+# 'error <why>'.  Commands are 'on', 'off', 'level <0-1>', 'ramp <seconds>'
+# and 'off_after <seconds>'.
+class alarmpi_lightserver(SocketServer.ThreadingMixIn,
+                          SocketServer.UnixStreamServer):
+  daemon_threads = True
+
+  def __init__(self, light, path, debug=False):
+    self.light = light
+    self.path = path
+    self.debug = debug
+    folder = os.path.dirname(path)
+    try:
+      if folder:
+        os.makedirs(folder)
+    except OSError:
+      if not os.path.isdir(folder):
+        raise
+    if os.path.exists(path):
+      os.remove(path) # Left over from a run that didn't exit cleanly
+    SocketServer.UnixStreamServer.__init__(self, path, alarmpi_lighthandler)
+    # The web server runs as another user.  So can anyone else who can get
+    # to the folder (see web/README.md).
+    os.chmod(path, 0666)
+
+  # Answer commands on a thread of our own until the process exits
+  def start(self):
+    thread = threading.Thread(target=self.serve_forever, name='light-server')
+    thread.daemon = True
+    thread.start()
+    atexit.register(self.close)
+
+  def close(self):
+    self.server_close()
+    try:
+      os.remove(self.path)
+    except OSError:
+      pass
+
+  def command(self, line):
+    words = line.split()
+    if not words:
+      raise ValueError('no command')
+    action, args = words[0], [float(a) for a in words[1:]]
+    if action not in ('on', 'off', 'level', 'ramp', 'off_after'):
+      raise ValueError('unknown command ' + action)
+    if self.debug:
+      print 'Light command: ' + line
+    getattr(self.light, action)(*args)
+
+class alarmpi_lighthandler(SocketServer.StreamRequestHandler):
+  def handle(self):
+    try:
+      self.server.command(self.rfile.readline().strip())
+      self.wfile.write('ok\n')
+    except (ValueError, TypeError) as e:
+      self.wfile.write('error ' + str(e) + '\n')
+
+# Send a command to the process serving the light at path.  Returns False
+# if nothing is listening there.
+def send(command, path, timeout=2):
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  client.settimeout(timeout)
+  try:
+    client.connect(path)
+    client.sendall(command + '\n')
+    answer = client.makefile().readline().strip()
+  except socket.error:
+    return False
+  finally:
+    client.close()
+  if answer != 'ok':
+    raise ValueError(answer)
+  return True
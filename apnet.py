@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import dns.resolver
+
+from apstore import alarmpi_store
+from aptrace import tracer
+
+# Recent results, so alarms going off together don't all probe:
+# hosts -> (time, netup)
+_recent = {}
+_recentlock = threading.Lock()
+
+# Finds out whether the network is up by resolving a few hosts at the same
+# time.  The answer is yes as soon as any of them resolves, and no if none
+# has by the timeout, so a dead network costs at most 'timeout' seconds.
+# The probe runs in the background: start() it early and only ask for the
+# result() when it is needed.
+class alarmpi_netprobe:
+  def __init__(self, hosts, timeout=2.0, ttl=30, folder=None, debug=False):
+    self.hosts = tuple(hosts)
+    self.timeout = timeout
+    self.ttl = ttl
+    self.debug = debug
+    # Share results with other processes through a file in folder (ramfldr,
+    # which we leave alone if it isn't there)
+    self.store = alarmpi_store(folder, debug, False) if folder else None
+    self.done = threading.Event()
+    self.netup = False
+    self.started = None
+
+  def start(self):
+    self.started = time.time()
+    cached = self._cached()
+    if cached is not None:
+      if self.debug:
+        print 'Network was ' + ('up' if cached else 'down') + \
+              ' a moment ago, not probing again.'
+      self._finish(cached, False)
+      return self
+    self.pending = len(self.hosts)
+    self.lock = threading.Lock()
+    for host in self.hosts:
+      worker = threading.Thread(target=self._resolve, args=(host,))
+      worker.daemon = True
+      worker.start()
+    return self
+
+  # True if the network is up.  Waits for the probe if it is still going.
+  def result(self):
+    if self.started is None:
+      self.start()
+    if not self.done.wait(max(self.started + self.timeout - time.time(), 0)):
+      if self.debug:
+        print 'No host resolved within ' + str(self.timeout) + \
+              ' seconds. Assuming the network is down.'
+      self._finish(False)
+    return self.netup
+
+  def _resolve(self, host):
+    try:
+      resolver = dns.resolver.Resolver()
+      resolver.lifetime = self.timeout
+      resolver.query(host)
+      self._finish(True)
+      return
+    except Exception:
+      if self.debug:
+        print('Could not resolve "' + host + '".')
+    with self.lock:
+      self.pending -= 1
+      if self.pending == 0:
+        self._finish(False)
+
+  def _finish(self, netup, remember=True):
+    with _recentlock:
+      if self.done.is_set():
+        return
+      self.netup = netup
+      self.done.set()
+      tracer.record('netprobe', self.started, time.time(), netup=netup,
+                    cached=not remember)
+      if not remember:
+        return
+      _recent[self.hosts] = (time.time(), netup)
+    if self.store is not None:
+      self.store.save('netstate', {
+        'hosts': list(self.hosts),
+        'time': time.time(),
+        'netup': netup,
+      })
+
+  def _cached(self):
+    now = time.time()
+    with _recentlock:
+      recent = _recent.get(self.hosts)
+    if recent is not None and 0 <= now - recent[0] < self.ttl:
+      return recent[1]
+    if self.store is not None:
+      saved = self.store.load('netstate')
+      if (saved is not None and
+          tuple(saved['hosts']) == self.hosts and
+          0 <= now - saved['time'] < self.ttl):
+        return saved['netup']
+    return None
@@ -0,0 +1,649 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import atexit
+import collections
+import os
+import Queue
+import shlex
+import shutil
+import StringIO
+import subprocess
+import tempfile
+import threading
+import time
+
+# One request to play some files, in order.  Whoever asked for it can
+# block in wait(), or pass a callback that is called with True (everything
+# played) or False (a file failed or we were stopped) when it is over.
+# Neither polls: wait() sleeps on an event that the player sets.
+class alarmpi_playback:
+  def __init__(self, files, callback=None, data=None):
+    self.files = list(files)
+    # Audio to play from memory instead of files
+    self.data = data
+    # How many of them have been started
+    self.played = 0
+    self.callback = callback
+    self.ok = None
+    self.done = threading.Event()
+
+  # Block until the files have played; returns True if they all did
+  def wait(self):
+    self.done.wait()
+    return self.ok
+
+  def _finish(self, ok):
+    if self.done.is_set():
+      return
+    self.ok = ok
+    self.done.set()
+    if self.callback is not None:
+      self.callback(ok)
+
+# A run of audio to be heard back to back, handed over a piece at a time
+# as the pieces become ready:
+#
+#   stream = player.stream(folder, '.mp3')
+#   stream.write(data, callback)     # audio in a string
+#   stream.writefile(fn, callback)   # audio in a file
+#   stream.close()                   # no more: True once it has all played
+#
+# callback is called with True or False once its piece is over.  This one
+# queues every piece on the player as a request of its own, which is all
+# that most players can do.
+class alarmpi_stream:
+  def __init__(self, player, folder=None):
+    self.player = player
+    self.folder = folder
+    self.playbacks = []
+
+  def write(self, data, callback=None):
+    self.playbacks.append(self.player.play_stream(data, callback,
+                                                  self.folder))
+
+  def writefile(self, fn, callback=None):
+    self.playbacks.append(self.player.play([fn], callback))
+
+  def close(self):
+    ok = True
+    for playback in self.playbacks:
+      if not playback.wait():
+        ok = False
+    return ok
+
+# A named pipe in a new folder of its own in folder, or in the system's
+# temporary folder if folder is None or can't be used (ramfldr isn't
+# mounted...).  Returns (the new folder, the pipe).
+def _fifo(folder=None):
+  try:
+    made = tempfile.mkdtemp(prefix='alarmpi-', dir=folder)
+  except (IOError, OSError) as e:
+    if folder is None:
+      raise
+    print 'Could not use ' + folder + ' for a named pipe: ' + str(e)
+    made = tempfile.mkdtemp(prefix='alarmpi-')
+  fifo = os.path.join(made, 'stream')
+  os.mkfifo(fifo)
+  return made, fifo
+
+# Plays files with a command line player ('mpg123 -q', 'aplay'...).  Play
+# requests are queued and handed to the player one at a time by a thread
+# that sleeps until there is something to do, then sleeps in wait() on the
+# player process until it exits.  If the command reads a playlist from
+# stdin ('mpg123 -@ -') the files are written there instead of being
+# added to the command line.
+class alarmpi_player:
+  def __init__(self, command, debug=False):
+    self.command = command
+    self.args = shlex.split(command)
+    self.playlist = '-@ -' in ' '.join(self.args)
+    self.debug = debug
+    self.queue = Queue.Queue()
+    self.lock = threading.Lock()
+    self.process = None
+    self.thread = None
+
+  # Queue files to be played after anything already queued.  Returns an
+  # alarmpi_playback straight away.
+  def play(self, files, callback=None):
+    return self._queue(alarmpi_playback(files, callback))
+
+  # Play files and wait until they are done; True if it worked
+  def playfiles(self, files):
+    return self.play(files).wait()
+
+  # Queue audio that is in memory (a string); the player gets it on stdin,
+  # so it never needs a folder
+  def play_stream(self, data, callback=None, folder=None):
+    return self._queue(alarmpi_playback([], callback, data))
+
+  # Pieces of audio to be played one after another (see alarmpi_stream)
+  def stream(self, folder=None, tail=None):
+    return alarmpi_stream(self, folder)
+
+  # Whether a stream of tail files plays as one, without a gap between them
+  def joins(self, tail):
+    return False
+
+  # A new process is started for every request; nothing to get ready
+  def warm(self):
+    pass
+
+  def _queue(self, playback):
+    with self.lock:
+      if self.thread is None:
+        self.thread = threading.Thread(target=self._run, name='player')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self._close)
+    self.queue.put(playback)
+    return playback
+
+  # Stop what is playing and drop everything queued
+  def stop(self):
+    dropped = []
+    with self.lock:
+      while True:
+        try:
+          dropped.append(self.queue.get_nowait())
+        except Queue.Empty:
+          break
+      if self.process is not None:
+        try:
+          self.process.terminate()
+        except OSError:
+          pass
+    for playback in dropped:
+      playback._finish(False)
+
+  # Let the thread finish before the interpreter goes away under it
+  def _close(self):
+    self.stop()
+    self.queue.put(None)
+    self.thread.join()
+
+  def _run(self):
+    while True:
+      playback = self.queue.get()
+      if playback is None:
+        return
+      if playback.files or playback.data is not None:
+        playback._finish(self._play(playback))
+      else:
+        playback._finish(True)
+
+  def _play(self, playback):
+    args = list(self.args)
+    stdin = None
+    if self.playlist or playback.data is not None:
+      stdin = subprocess.PIPE
+      if playback.data is not None:
+        args = [a for a in args if a not in ('-@', '-')] + ['-']
+    else:
+      args.extend(playback.files)
+    if self.debug:
+      print 'Calling "' + ' '.join(args) + '"'
+    with self.lock:
+      try:
+        self.process = subprocess.Popen(args, stdin=stdin)
+      except OSError as e:
+        print 'Could not start ' + self.command + ': ' + str(e)
+        return False
+      process = self.process
+    if stdin is not None:
+      try:
+        if playback.data is not None:
+          process.stdin.write(playback.data)
+        else:
+          process.stdin.write('\n'.join(playback.files) + '\n')
+        process.stdin.close()
+      except IOError:
+        pass # The player went away; wait() tells us how
+    status = process.wait()
+    with self.lock:
+      self.process = None
+    return status == 0
+
+# Drives one long-lived 'mpg123 -R' (remote control mode) for the whole
+# run.  Files are queued and each one is loaded the moment the one before
+# it ends, so pieces of speech follow each other without mpg123 starting
+# up and opening the sound card every time.  Speech made of MP3 pieces is
+# gapless on top of that: a stream() is one named pipe that mpg123 loads
+# once and plays through while the pieces are written into it (see
+# alarmpi_mpg123stream).  A thread reads what mpg123 reports (start, end,
+# errors, position) as it happens.  Byte streams are played through a named
+# pipe, so they never touch the disk.
+class alarmpi_mpg123:
+  def __init__(self, command, debug=False):
+    self.command = command
+    args = shlex.split(command)
+    # A playlist on stdin can't work: stdin is how we talk to it
+    while '-@' in args:
+      i = args.index('-@')
+      del args[i:i + 2]
+    self.args = args + ['-R']
+    self.debug = debug
+    self.lock = threading.Condition()
+    self.process = None
+    # (playback, file) still to play, the one playing first
+    self.pending = collections.deque()
+    self.playing = False
+    # Samples per second of the current file, and its position from SAMPLE
+    self.rate = None
+    self.sample = None
+    # '@P 0's still to come for files we stopped, not ones that ended
+    self.stopped = 0
+    self.reader = None
+    atexit.register(self._close)
+
+  def play(self, files, callback=None):
+    playback = alarmpi_playback(files, callback)
+    if not playback.files:
+      playback._finish(True)
+      return playback
+    with self.lock:
+      if not self._start():
+        playback._finish(False)
+        return playback
+      for fn in playback.files:
+        self.pending.append((playback, fn))
+      if not self.playing:
+        self._next()
+    return playback
+
+  def playfiles(self, files):
+    return self.play(files).wait()
+
+  # Play data (a string or a file-like object) as if it were a file.  It
+  # goes through a named pipe in folder (the system's temporary folder if
+  # None; pass [main] ramfldr to keep off the SD card).
+  def play_stream(self, data, callback=None, folder=None):
+    folder, fifo = _fifo(folder)
+    def done(ok):
+      self._release(fifo)
+      shutil.rmtree(folder, ignore_errors=True)
+      if callback is not None:
+        callback(ok)
+    playback = self.play([fifo], done)
+    writer = threading.Thread(target=self._write, args=(fifo, data, playback),
+                              name='player-stream')
+    writer.daemon = True
+    writer.start()
+    return playback
+
+  # MP3 frames can simply follow each other, so MP3 pieces are played as
+  # one continuous stream; anything else a piece at a time
+  def stream(self, folder=None, tail=None):
+    if self.joins(tail):
+      return alarmpi_mpg123stream(self, folder)
+    return alarmpi_stream(self, folder)
+
+  def joins(self, tail):
+    return (tail or '').strip().lower() == '.mp3'
+
+  # Start mpg123 ahead of the first file, so that it plays straight away
+  def warm(self):
+    with self.lock:
+      return self._start()
+
+  # Where we are in the current file: (file, seconds in, seconds left), or
+  # None if nothing is playing
+  def position(self):
+    with self.lock:
+      if not self.playing or self.process is None:
+        return None
+      fn = self.pending[0][1]
+      self.sample = None
+      self._send('SAMPLE')
+      deadline = time.time() + 1
+      while self.sample is None and self.playing and time.time() < deadline:
+        self.lock.wait(deadline - time.time())
+      if self.sample is None or not self.rate:
+        return None
+      current, total = self.sample
+      return (fn, float(current) / self.rate,
+              float(total - current) / self.rate)
+
+  def stop(self):
+    with self.lock:
+      dropped = [playback for playback, fn in self.pending]
+      self.pending.clear()
+      if self.playing:
+        self._send('STOP')
+        self.stopped += 1
+      self.playing = False
+      self.lock.notify_all()
+    for playback in dropped:
+      playback._finish(False)
+
+  # Start mpg123 if it isn't running.  Called with the lock held.
+  def _start(self):
+    if self.process is not None:
+      return True
+    if self.debug:
+      print 'Starting "' + ' '.join(self.args) + '"'
+    try:
+      self.process = subprocess.Popen(self.args, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE)
+    except OSError as e:
+      print 'Could not start ' + self.command + ': ' + str(e)
+      return False
+    # We ask for the position when we want it, rather than being told
+    # it dozens of times a second
+    self._send('SILENCE')
+    self.reader = threading.Thread(target=self._read, args=(self.process,),
+                                   name='player-reader')
+    self.reader.daemon = True
+    self.reader.start()
+    return True
+
+  def _send(self, line):
+    try:
+      self.process.stdin.write(line + '\n')
+      self.process.stdin.flush()
+    except (IOError, ValueError):
+      pass # It died; the reader finds out and cleans up
+
+  # Load the next queued file.  Called with the lock held.
+  def _next(self):
+    self.playing = bool(self.pending)
+    if self.playing:
+      fn = self.pending[0][1]
+      if self.debug:
+        print 'Playing ' + fn
+      self.rate = None
+      self._send('LOAD ' + fn)
+
+  # The file at the head of the queue is over
+  def _ended(self, ok):
+    with self.lock:
+      if self.stopped:
+        self.stopped -= 1
+        return
+      if not self.pending:
+        self.playing = False
+        return
+      playback, fn = self.pending.popleft()
+      if not ok:
+        playback.ok = False
+      last = not any(p is playback for p, f in self.pending)
+      self._next()
+      self.lock.notify_all()
+    if last:
+      playback._finish(playback.ok is not False)
+
+  def _read(self, process):
+    for line in iter(process.stdout.readline, ''):
+      words = line.split()
+      if not words:
+        continue
+      if words[0] == '@P' and words[1:] == ['0']:
+        self._ended(True)
+      elif words[0] == '@E':
+        if self.debug:
+          print 'mpg123: ' + line.strip()
+        with self.lock:
+          failed = self.playing
+        if failed:
+          self._ended(False)
+      elif words[0] == '@S' and len(words) > 3:
+        with self.lock:
+          self.rate = int(words[3])
+      elif words[0] == '@SAMPLE' and len(words) > 2:
+        with self.lock:
+          self.sample = (int(words[1]), int(words[2]))
+          self.lock.notify_all()
+    # mpg123 went away: whatever was queued won't play.  The next play()
+    # starts a new one.
+    process.wait()
+    with self.lock:
+      if self.process is process:
+        self.process = None
+      dropped = [playback for playback, fn in self.pending]
+      self.pending.clear()
+      self.playing = False
+      self.stopped = 0
+      self.lock.notify_all()
+    for playback in dropped:
+      playback._finish(False)
+
+  # If we were stopped before mpg123 opened the pipe, the writer is still
+  # waiting in open() for a reader.  Be that reader for a moment: the
+  # writer gets in, finds nobody reading and gives up.
+  def _release(self, fifo):
+    try:
+      os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+    except OSError:
+      pass
+
+  def _write(self, fifo, data, playback):
+    try:
+      # Blocks until mpg123 opens the other end
+      with open(fifo, 'wb') as f:
+        if isinstance(data, str):
+          f.write(data)
+        else:
+          shutil.copyfileobj(data, f)
+    except IOError:
+      pass # mpg123 stopped reading; it reports why
+
+  # The reader waits for mpg123 to quit; only one thread may wait for it
+  def _close(self):
+    with self.lock:
+      process = self.process
+      if process is not None:
+        self._send('QUIT')
+    if process is not None:
+      self.reader.join()
+
+# MP3 pieces played by mpg123 as one: a named pipe in folder (the system's
+# temporary folder if None) that mpg123 loads once, while a thread of ours
+# writes each piece into it as it comes.  There is no LOAD between pieces,
+# and so no gap.  If a piece isn't ready by the time mpg123 has played the
+# last one, mpg123 just waits for it.  mpg123 only tells us when the whole
+# stream is over, so that is when every piece's callback is called.
+class alarmpi_mpg123stream:
+  def __init__(self, player, folder=None):
+    self.player = player
+    self.folder, self.fifo = _fifo(folder)
+    self.lock = threading.Lock()
+    self.callbacks = []
+    # How the stream ended, once it has, and set once every callback has
+    # been told
+    self.ok = None
+    self.over = threading.Event()
+    # Pieces for the writer: a string of audio, a ('file', fn) or None
+    # when there are no more
+    self.pieces = Queue.Queue()
+    player.play([self.fifo], self._done)
+    self.writer = threading.Thread(target=self._write, name='player-stream')
+    self.writer.daemon = True
+    self.writer.start()
+
+  def write(self, data, callback=None):
+    self._put(data, callback)
+
+  def writefile(self, fn, callback=None):
+    self._put(('file', fn), callback)
+
+  def close(self):
+    self.pieces.put(None)
+    self.over.wait()
+    return self.ok
+
+  def _put(self, piece, callback):
+    with self.lock:
+      over = self.ok is not None
+      if not over:
+        if callback is not None:
+          self.callbacks.append(callback)
+        self.pieces.put(piece)
+    if over and callback is not None:
+      callback(False) # Stopped, or mpg123 went away
+
+  def _done(self, ok):
+    self.player._release(self.fifo)
+    shutil.rmtree(self.folder, ignore_errors=True)
+    with self.lock:
+      self.ok = ok
+      callbacks, self.callbacks = self.callbacks, []
+    try:
+      for callback in callbacks:
+        callback(ok)
+    finally:
+      self.over.set()
+
+  def _write(self):
+    try:
+      # Blocks until mpg123 opens the other end
+      f = open(self.fifo, 'wb')
+    except IOError:
+      f = None
+    while True:
+      piece = self.pieces.get()
+      if piece is None:
+        break
+      if f is None:
+        continue # mpg123 stopped reading; it reports why
+      try:
+        if isinstance(piece, str):
+          f.write(piece)
+        else:
+          with open(piece[1], 'rb') as src:
+            shutil.copyfileobj(src, f)
+        f.flush()
+      except IOError:
+        self._discard(f)
+        f = None
+    if f is not None:
+      self._discard(f)
+
+  def _discard(self, f):
+    try:
+      f.close()
+    except IOError:
+      pass
+
+# Plays files through pygame's mixer, which is opened once and stays open.
+# A thread of its own owns pygame: it sleeps in pygame.event.wait() and
+# wakes up for the mixer's end-of-track event or for a request posted by
+# play() or stop().
+class alarmpi_mixer:
+  def __init__(self, debug=False):
+    self.debug = debug
+    self.lock = threading.Lock()
+    self.ready = threading.Event()
+    self.thread = None
+    self.error = None
+    # Requests not finished yet, the one playing first
+    self.playing = collections.deque()
+
+  def play(self, files, callback=None):
+    playback = alarmpi_playback(files, callback)
+    if not self._start():
+      playback._finish(False)
+      return playback
+    import pygame
+    pygame.event.post(pygame.event.Event(self.PLAY, playback=playback))
+    return playback
+
+  def playfiles(self, files):
+    return self.play(files).wait()
+
+  # pygame loads audio from file objects as well as files
+  def play_stream(self, data, callback=None, folder=None):
+    return self.play([StringIO.StringIO(data)], callback)
+
+  def stream(self, folder=None, tail=None):
+    return alarmpi_stream(self, folder)
+
+  def joins(self, tail):
+    return False
+
+  # Open the mixer ahead of the first file
+  def warm(self):
+    return self._start()
+
+  def stop(self):
+    if self._start():
+      import pygame
+      pygame.event.post(pygame.event.Event(self.STOP))
+
+  # Open the mixer the first time we need it
+  def _start(self):
+    with self.lock:
+      if self.thread is None:
+        self.thread = threading.Thread(target=self._run, name='mixer')
+        self.thread.daemon = True
+        self.thread.start()
+    self.ready.wait()
+    return self.error is None
+
+  def _run(self):
+    try:
+      import pygame
+      # The event queue needs a display, even one that shows nothing
+      os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+      pygame.display.init()
+      pygame.mixer.init()
+      self.ENDED = pygame.USEREVENT
+      self.PLAY = pygame.USEREVENT + 1
+      self.STOP = pygame.USEREVENT + 2
+      pygame.mixer.music.set_endevent(self.ENDED)
+    except Exception as e:
+      self.error = e
+      print 'Could not open the mixer: ' + repr(e)
+      self.ready.set()
+      return
+    self.ready.set()
+
+    music = pygame.mixer.music
+    while True:
+      event = pygame.event.wait()
+      if event.type == self.PLAY:
+        self.playing.append(event.playback)
+        if len(self.playing) == 1:
+          self._next(music)
+      elif event.type == self.ENDED and self.playing:
+        self._next(music)
+      elif event.type == self.STOP:
+        music.stop()
+        while self.playing:
+          self.playing.popleft()._finish(False)
+
+  # Start the next file of the current request, moving on to the next
+  # request when it has none left
+  def _next(self, music):
+    while self.playing:
+      playback = self.playing[0]
+      if playback.played == len(playback.files):
+        self.playing.popleft()._finish(True)
+        continue
+      fn = playback.files[playback.played]
+      playback.played += 1
+      try:
+        music.load(fn)
+        music.play()
+        return
+      except Exception as e:
+        if self.debug:
+          print 'Could not play ' + str(fn) + ': ' + repr(e)
+        self.playing.popleft()._finish(False)
+
+# One player per command, shared by everything in the process.  mpg123
+# commands get a persistent mpg123 in remote control mode, and 'pygame'
+# plays through pygame's mixer.
+_players = {}
+_lock = threading.Lock()
+
+def player(command, debug=False):
+  command = command.strip()
+  with _lock:
+    if command not in _players:
+      if command == 'pygame':
+        _players[command] = alarmpi_mixer(debug)
+      elif os.path.basename(shlex.split(command)[0]) == 'mpg123':
+        _players[command] = alarmpi_mpg123(command, debug)
+      else:
+        _players[command] = alarmpi_player(command, debug)
+    return _players[command]
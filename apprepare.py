@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import time
+
+from apstore import alarmpi_store
+
+# Keeps track of audio that was synthesized ahead of the alarm by
+# 'sound_the_alarm.py --prepare' so that '--fire' only has to play it.
+# Every config file gets a folder of its own, so alarms sharing a ramfldr
+# never clear each other's audio.
+class alarmpi_prepared:
+  manifest = 'manifest.json'
+
+  def __init__(self, folder, configfile, maxage, debug=False):
+    self.configfile = os.path.abspath(configfile)
+    self.folder = os.path.join(folder, 'prepared-' +
+                               alarmpi_store.key(self.configfile)[:12], '')
+    self.maxage = maxage
+    self.debug = debug
+
+  # Remove anything left over from an earlier prepare of this config
+  def clear(self):
+    shutil.rmtree(self.folder, True)
+
+  # Make an empty folder for the engine to synthesize into.  Only ours:
+  # ramfldr has to be there already (see alarmpi_store).
+  def create(self):
+    self.clear()
+    os.mkdir(self.folder)
+    return self.folder
+
+  # Record which engine produced which files.  segments are in play
+  # order, each either {'files': [...]} or {'section': name} for a section
+  # fire() builds itself.
+  def save(self, engine, segments):
+    manifest = {
+      'time': time.time(),
+      'config': self.configfile,
+      'engine': engine,
+      'segments': segments,
+    }
+    tmpfn = os.path.join(self.folder, self.manifest + '.tmp')
+    with open(tmpfn, 'w') as f:
+      json.dump(manifest, f)
+    os.rename(tmpfn, os.path.join(self.folder, self.manifest))
+
+  # Returns (engine, segments) if there is prepared audio we can still use,
+  # None if it is missing, stale or belongs to another config file.
+  def load(self):
+    try:
+      with open(os.path.join(self.folder, self.manifest)) as f:
+        manifest = json.load(f)
+    except (IOError, ValueError):
+      if self.debug:
+        print 'No prepared audio in ' + self.folder
+      return None
+
+    age = time.time() - manifest['time']
+    if age > self.maxage or age < 0:
+      if self.debug:
+        print 'Prepared audio is stale (' + str(int(age)) + ' seconds old).'
+      return None
+    if manifest['config'] != self.configfile:
+      if self.debug:
+        print 'Prepared audio is for ' + manifest['config']
+      return None
+    for segment in manifest['segments']:
+      for fn in segment.get('files', []):
+        if not os.path.isfile(fn):
+          if self.debug:
+            print 'Prepared audio file ' + fn + ' is missing.'
+          return None
+    return (manifest['engine'], manifest['segments'])
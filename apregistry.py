@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import re
+import threading
+import time
+
+from aptrace import tracer
+
+# Finds the handler modules (get_<handler>.py) and imports them only when
+# they are needed.  Some pull in heavy libraries (pygame and pyvona for
+# tryivona) that take seconds to import on a Pi.
+class alarmpi_registry:
+  def __init__(self, folder=None):
+    if folder is None:
+      folder = os.path.dirname(os.path.abspath(__file__))
+    self.folder = folder
+    self.lock = threading.Lock()
+    # handler -> seconds it took to import, in import order
+    self.imported = []
+    # Print import times as they happen
+    self.profile = False
+
+  def _filename(self, handler):
+    return os.path.join(self.folder, 'get_' + handler + '.py')
+
+  # Names of all the handlers we could load, without importing any of them
+  def handlers(self):
+    names = []
+    for fn in sorted(os.listdir(self.folder)):
+      m = re.match(r'get_(\w+)\.py$', fn)
+      if m:
+        names.append(m.group(1))
+    return names
+
+  # Make sure handler exists and is of type stype, without importing it
+  def check(self, handler, stype):
+    try:
+      with open(self._filename(handler)) as f:
+        source = f.read()
+    except IOError:
+      raise ImportError('No handler module get_' + handler + '.py')
+    m = re.search(r'^class\s+' + handler + r'\s*\(\s*(\w+)', source, re.M)
+    if m is None:
+      raise ImportError('get_' + handler + '.py has no class ' + handler)
+    base = m.group(1)
+    if base.startswith('alarmpi_') and base != 'alarmpi_' + stype:
+      raise ImportError(handler + ' is an ' + base + ', not ' + stype)
+
+  # Import a handler and return its class
+  def load(self, handler):
+    getsec = 'get_' + handler
+    with self.lock:
+      start = time.time()
+      module = __import__(getsec, fromlist=[handler])
+      spent = time.time() - start
+      if handler not in [h for h, s in self.imported]:
+        self.imported.append((handler, spent))
+        tracer.record('import', start, start + spent, handler=handler)
+        if self.profile:
+          print 'import ' + getsec + ': ' + '%.3f' % spent + 's'
+    return getattr(module, handler)
+
+  # An instance of handler that is only imported and constructed when
+  # something on it is first used
+  def lazy(self, handler, stype, sconfig, debug, main):
+    return lazysection(self, handler, stype, sconfig, debug, main)
+
+  def report(self, handlers=()):
+    lines = ['Handler import times:']
+    total = 0
+    for handler, spent in self.imported:
+      lines.append('  %-20s %8.3fs' % (handler, spent))
+      total += spent
+    lines.append('  %-20s %8.3fs' % ('total', total))
+    loaded = [h for h, s in self.imported]
+    deferred = [h for h in handlers if h not in loaded]
+    if deferred:
+      lines.append('Deferred until used: ' + ', '.join(deferred))
+    return '\n'.join(lines)
+
+# Stands in for a section until it is really needed
+class lazysection(object):
+  def __init__(self, registry, handler, stype, sconfig, debug, main):
+    self._registry = registry
+    self._handler = handler
+    self._args = (stype, sconfig, debug)
+    self._section = None
+    self.stype = stype
+    # Shared with the real section once it exists, so that changes (the
+    # net state) made before then are not lost
+    self.main = dict(main)
+
+  def loaded(self):
+    return self._section is not None
+
+  def _load(self):
+    if self._section is None:
+      construct = self._registry.load(self._handler)
+      stype, sconfig, debug = self._args
+      self._section = construct(stype, sconfig, debug, self.main.items())
+      self.main = self._section.main
+    return self._section
+
+  def __getattr__(self, name):
+    return getattr(self._load(), name)
+
+# The registry everybody shares
+registry = alarmpi_registry()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from multiprocessing import TimeoutError
+import threading
+import time
+
+# Work that alarms running in the same process (alarm_daemon.py with many
+# config files) would otherwise do once each.  The first alarm to ask for
+# a key does the work; one that asks while it is under way waits for it,
+# and one that asks up to 'window' seconds after it finished gets the same
+# result without any work at all.
+class alarmpi_shared:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.entries = {}
+
+  # The result of work() for key.  shareable(result) says whether someone
+  # else may use it (a file its owner is going to remove can't be).  Waiting
+  # for someone else's work stops at deadline (a time), or once the event
+  # cancel is set, with a TimeoutError: their work doesn't hold us up any
+  # longer than our own would have been allowed to.
+  def get(self, key, window, work, shareable=None, deadline=None,
+          cancel=None):
+    with self.lock:
+      self._prune(window)
+      entry = self.entries.get(key)
+      owner = entry is None
+      if owner:
+        entry = self.entries[key] = _entry()
+    if owner:
+      return entry.run(work)
+    if deadline is None and cancel is None:
+      entry.done.wait()
+    else:
+      while not entry.done.wait(0.1):
+        if ((deadline is not None and time.time() >= deadline) or
+            (cancel is not None and cancel.is_set())):
+          raise TimeoutError('Gave up waiting for ' + repr(key))
+    if entry.error or (shareable is not None and not shareable(entry.result)):
+      return work()
+    return entry.result
+
+  # Forget work that finished too long ago to be used.  Called with the
+  # lock held.
+  def _prune(self, window):
+    now = time.time()
+    for key, entry in self.entries.items():
+      if entry.done.is_set() and now - entry.finished > window:
+        del self.entries[key]
+
+class _entry:
+  def __init__(self):
+    self.done = threading.Event()
+    self.finished = None
+    self.result = None
+    self.error = False
+
+  def run(self, work):
+    try:
+      self.result = work()
+      return self.result
+    except Exception:
+      self.error = True
+      raise
+    finally:
+      self.finished = time.time()
+      self.done.set()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import uuid
+
+# Small JSON documents kept on local disk between runs (feed validators,
+# last good content...).  Writes go to a temporary file that is renamed
+# into place, so a reader never sees half of one.  The folder is made if
+# it isn't there, unless create is False: a store in ramfldr must not end
+# up on the SD card because the ramdrive isn't mounted, so it saves
+# nothing instead.
+class alarmpi_store:
+  def __init__(self, folder, debug=False, create=True):
+    self.folder = folder
+    self.debug = debug
+    self.create = create
+
+  # Make a store from the [main] items handed to a section
+  @classmethod
+  def from_main(cls, main, debug=False):
+    return cls(main.get('statefldr', 'state/'), debug)
+
+  # A file name safe key for anything
+  @staticmethod
+  def key(*parts):
+    return hashlib.sha1('\0'.join(str(p) for p in parts)).hexdigest()
+
+  def _filename(self, name):
+    return os.path.join(self.folder, name + '.json')
+
+  # The document saved as name, or None
+  def load(self, name):
+    try:
+      with open(self._filename(name)) as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return None
+
+  def save(self, name, document):
+    tmpfn = os.path.join(self.folder, '.' + str(uuid.uuid4()))
+    if not self.create and not os.path.isdir(self.folder):
+      if self.debug:
+        print 'Not saving ' + name + ': ' + self.folder + ' is missing'
+      return
+    try:
+      try:
+        os.makedirs(self.folder)
+      except OSError:
+        # Another alarm may have just made it
+        if not os.path.isdir(self.folder):
+          raise
+      with open(tmpfn, 'w') as f:
+        json.dump(document, f)
+      os.rename(tmpfn, self._filename(name))
+    except (IOError, OSError) as e:
+      if self.debug:
+        print 'Could not save ' + name + ': ' + str(e)
+      try:
+        os.remove(tmpfn)
+      except OSError:
+        pass
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+# The trace file in statefldr, unless we are told where it is
+TRACENAME = 'trace.jsonl'
+
+# The trace file report() reads by default: the one for the default
+# statefldr, next to our code
+TRACEFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'state', TRACENAME)
+
+# Records how long each phase of an alarm takes.  Every span is written as
+# a line of JSON to the trace file:
+#
+#   {"run": ..., "name": "build", "start": ..., "end": ..., "dur": ...,
+#    "thread": ..., "section": "weather_yahoo"}
+#
+# Tracing is off until enable() is called, and costs next to nothing then.
+#
+# Each thread knows which run it is working for, so that alarms running at
+# the same time in one process (alarm_daemon.py) don't mix their spans.  A
+# thread started for a run picks it up through carry(); any other thread's
+# spans go to the run started last.
+class alarmpi_tracer:
+  def __init__(self):
+    self.on = False
+    self.path = None
+    self.run = None
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    # Spans recorded before we know where the trace file is
+    self.pending = []
+
+  # Trace to path, or (if None) to trace.jsonl in the folder given to
+  # place() once the config has been read
+  def enable(self, path=None):
+    self.on = True
+    if path:
+      self._open(path)
+    self.newrun()
+
+  def enabled(self):
+    return self.on
+
+  # The config's statefldr is known: unless enable() was given a file,
+  # the trace goes there, starting with what was recorded so far
+  def place(self, folder):
+    with self.lock:
+      if self.on and self.path is None:
+        self._open(os.path.join(folder, TRACENAME))
+
+  # Called with the lock held, or before there are other threads
+  def _open(self, path):
+    folder = os.path.dirname(path)
+    try:
+      if folder:
+        os.makedirs(folder)
+    except OSError:
+      if not os.path.isdir(folder):
+        raise
+    self.path = path
+    pending, self.pending = self.pending, []
+    if pending:
+      with open(self.path, 'a') as f:
+        f.writelines(pending)
+
+  # Spans from now on (on this thread, and those it carries the run to)
+  # belong to a new run
+  def newrun(self):
+    self.run = self.local.run = uuid.uuid4().hex[:12]
+    return self.run
+
+  # The run this thread is working for
+  def current(self):
+    return getattr(self.local, 'run', None) or self.run
+
+  # fn, for another thread to call as part of this thread's run
+  def carry(self, fn):
+    run = self.current()
+    def carried(*args, **kwargs):
+      self.local.run = run
+      return fn(*args, **kwargs)
+    return carried
+
+  # with tracer.span('build', section='news'): ...
+  def span(self, name, **attrs):
+    return _span(self, name, attrs)
+
+  # Write a span that has already happened
+  def record(self, name, start, end, **attrs):
+    if not self.on:
+      return
+    line = {
+      'run': self.current(),
+      'name': name,
+      'start': start,
+      'end': end,
+      'dur': end - start,
+      'thread': threading.current_thread().name,
+    }
+    line.update(attrs)
+    line = json.dumps(line) + '\n'
+    with self.lock:
+      if self.path is None:
+        self.pending.append(line)
+        return
+      with open(self.path, 'a') as f:
+        f.write(line)
+
+class _span:
+  def __init__(self, tracer, name, attrs):
+    self.tracer = tracer
+    self.name = name
+    self.attrs = attrs
+
+  # Add to the attributes from inside the span
+  def set(self, **attrs):
+    self.attrs.update(attrs)
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, etype, value, tb):
+    if etype is not None:
+      self.attrs['error'] = repr(value)
+    self.tracer.record(self.name, self.start, time.time(), **self.attrs)
+    return False
+
+# The tracer everybody shares
+tracer = alarmpi_tracer()
+
+def load(path):
+  runs = {}
+  order = []
+  with open(path) as f:
+    for line in f:
+      try:
+        span = json.loads(line)
+      except ValueError:
+        continue # A line cut short
+      if span['run'] not in runs:
+        runs[span['run']] = []
+        order.append(span['run'])
+      runs[span['run']].append(span)
+  return [runs[run] for run in order]
+
+def label(span):
+  extra = [str(v) for k, v in sorted(span.items())
+           if k not in ('run', 'name', 'start', 'end', 'dur', 'thread')]
+  return span['name'] + (' ' + ' '.join(extra) if extra else '')
+
+# Walk back from the span that ended last, each time to the longest span
+# that had finished by the time the current one started.  What is left is
+# the chain of waits that made the run take as long as it did.
+def critical_path(spans):
+  spans = [s for s in spans if s['name'] != 'run']
+  if not spans:
+    return []
+  current = max(spans, key=lambda s: s['end'])
+  path = [current]
+  while True:
+    before = [s for s in spans if s['end'] <= current['start'] + 0.001 and
+                                  s['start'] < current['start']]
+    if not before:
+      break
+    latest = max(s['end'] for s in before)
+    current = max([s for s in before if s['end'] >= latest - 0.05],
+                  key=lambda s: s['dur'])
+    path.append(current)
+  path.reverse()
+  return path
+
+def report(path, runs=10):
+  allruns = load(path)[-runs:]
+  if not allruns:
+    return 'No runs traced in ' + path
+  lines = []
+  last = allruns[-1]
+  first = min(s['start'] for s in last)
+  end = max(s['end'] for s in last)
+  lines.append('Last run ' + last[0]['run'] + ' (' +
+               time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first)) +
+               '), %.3fs' % (end - first))
+  lines.append('Critical path:')
+  for span in critical_path(last):
+    lines.append('  %+8.3fs %8.3fs  %s' % (span['start'] - first, span['dur'],
+                                         label(span)))
+
+  builds = {}
+  for run in allruns:
+    for span in run:
+      if span['name'] == 'build':
+        builds.setdefault(span.get('section', '?'), []).append(span['dur'])
+  if builds:
+    lines.append('Slowest sections over the last ' + str(len(allruns)) +
+                 ' runs:')
+    lines.append('  %-20s %5s %8s %8s' % ('section', 'runs', 'mean', 'max'))
+    for section, durs in sorted(builds.items(), key=lambda b: -max(b[1])):
+      lines.append('  %-20s %5d %7.3fs %7.3fs' % (section, len(durs),
+                                                 sum(durs) / len(durs),
+                                                 max(durs)))
+  return '\n'.join(lines)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Report on alarm traces')
+  parser.add_argument("--file", help="trace file to read", default=TRACEFILE)
+  parser.add_argument("--runs", help="how many recent runs to look at",
+                      type=int, default=10)
+  args = parser.parse_args()
+  print report(args.file, args.runs)
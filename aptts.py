@@ -1,13 +1,364 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import os
+import Queue
+import re
+import textwrap
+import threading
+import time
+import uuid
+
+import applayer
 from apsection import alarmpi_section
+from apshare import alarmpi_shared
+from apttscache import alarmpi_ttscache
+from aptrace import tracer
+import utilities
+
+# Split content into the pieces we hand to an engine one at a time.  Whole
+# sentences are packed into pieces of at most limit characters (0 means no
+# limit), and sentences that are too long on their own are wrapped on
+# words.  Sections of the wad (separated by 3 or more spaces) never share a
+# piece, so phrases that come back every day are cached on their own.
+def plan_chunks(content, limit=0):
+  chunks = []
+  for part in re.split(r'\s{3,}', content):
+    current = ''
+    for sentence in re.split(r'(?<=[.!?])\s+', part):
+      sentence = ' '.join(sentence.split())
+      if not sentence:
+        continue
+      if current and (not limit or len(current) + 1 + len(sentence) <= limit):
+        current += ' ' + sentence
+        continue
+      if current:
+        chunks.append(current)
+      current = ''
+      if not limit or len(sentence) <= limit:
+        current = sentence
+      else:
+        parts = textwrap.wrap(sentence, limit)
+        chunks.extend(parts[:-1])
+        current = parts[-1]
+    if current:
+      chunks.append(current)
+  return chunks
+
+# Pieces synthesized for the alarms in this process, shared between them
+renders = alarmpi_shared()
 
 class alarmpi_tts(alarmpi_section):
+  # Longest piece of text the engine accepts at once (0 means no limit)
+  chunk_limit = 0
+  # True if the engine implements render_data()
+  streams = False
+
+  def __init__(self, stype, sconfig, debug, main):
+    alarmpi_section.__init__(self, stype, sconfig, debug, main)
+    self.cache = alarmpi_ttscache.from_main(self.main, debug)
+
+  # Speak content.  Pieces are synthesized (or taken from the cache) in the
+  # background and played in order as soon as each one is ready.
+  def play(self, content, ramdrive=None):
+    stream = self.stream(ramdrive)
+    stream.feed(content)
+    return stream.finish()
+
+  # Speak text as it is fed in, a section at a time:
+  #
+  #   stream = engine.stream(ramdrive)
+  #   stream.feed('Good morning.')
+  #   stream.feed(news)
+  #   stream.finish()
+  def stream(self, ramdrive=None):
+    return alarmpi_ttsstream(self, self._ramdrive(ramdrive))
+
+  # Turn content into audio files in ramdrive (by default [main] ramfldr)
+  # without playing them.
+  # Returns the files in play order, or False if that didn't work.
+  def synthesize(self, content, ramdrive=None):
+    pool = None
+    files = []
+    try:
+      pool, renders, cancel = self._render(content, self._ramdrive(ramdrive),
+                                           True)
+      for render in renders:
+        fn = render.get()
+        if fn is None:
+          break
+        files.append(fn)
+      else:
+        return files
+    except Exception as e:
+      if self.debug:
+        print self.stype + ': ' + str(e)
+    if pool is not None:
+      self._stop(pool, renders, cancel)
+    return False
 
-  def play(self, content, ramdrive='/mnt/ram/'):
+  # Play files made by synthesize(), as one stream if the player can
+  # join them up
+  def playfiles(self, files):
+    player = self.player()
+    if not player.joins(self.sconfig['tail']):
+      return player.playfiles(files)
+    stream = player.stream(self._ramdrive(), self.sconfig['tail'])
+    for fn in files:
+      stream.writefile(fn)
+    return stream.close()
+
+  # The shared player (see applayer) our audio goes to.  Engines that play
+  # their audio some other way override this.
+  def player(self):
+    return applayer.player(self.sconfig['player'], self.debug)
+
+  # Synthesize text into the audio file fn.  Returns True if it worked.
+  def render(self, text, fn):
+    if self.streams:
+      data = self.render_data(text)
+      if not data:
+        return False
+      with open(fn, 'wb') as f:
+        f.write(data)
+      return True
     self.content='Instance of ' + \
                  self.stype + \
-                 ' class play method called with:\n\n\t' + \
-                 content
+                 ' class render method called with:\n\n\t' + \
+                 text
     print self.content
     return False
+
+  # Text as the engine should get it.  Every piece of text goes through
+  # here before it is split up, cached or rendered.
+  def normalize(self, text):
+    return utilities.normalizeText(text)
+
+  # Engines with streams set synthesize text in memory: they return the
+  # audio as a string here (None if that didn't work), and it goes
+  # straight to the player without being written anywhere.
+  def render_data(self, text):
+    return None
+
+  # Part of the cache key: anything in sconfig that changes how we sound
+  def voice(self):
+    return ''
+
+  # Number of pieces we synthesize at the same time
+  def workers(self):
+    return int(self.sconfig.get('fetchers', 1))
+
+  # Start synthesizing the pieces of content.  Returns the pool, the
+  # pending results (audio file or None) in play order and an event that
+  # tells pieces still in progress that nobody wants them any more.
+  def _render(self, content, ramdrive, keep=False):
+    chunks = plan_chunks(self.normalize(content), self.chunk_limit)
+    cancel = threading.Event()
+    pool = ThreadPool(max(min(self.workers(), len(chunks)), 1))
+    render = tracer.carry(self._render_chunk)
+    renders = [pool.apply_async(render, (chunk, ramdrive, keep, cancel))
+               for chunk in chunks]
+    pool.close()
+    return pool, renders, cancel
+
+  # Done with the pieces.  Ones already finished are removed here, ones
+  # still rendering remove their own file when they finish.
+  def _stop(self, pool, renders, cancel):
+    cancel.set()
+    pool.terminate()
+    self._cleanup([r.get() for r in renders if r.ready() and r.successful()])
+
+  # Returns the audio for text: a file of our own in ramdrive, for the
+  # caller to remove once played, or an alarmpi_audiodata if it is only in
+  # memory (never with keep set).
+  def _render_chunk(self, text, ramdrive, keep, cancel):
+    if cancel.is_set():
+      return None
+    with tracer.span('synth', engine=self.__class__.__name__,
+                     chars=len(text)) as span:
+      try:
+        fn = self._cached_chunk(text, ramdrive, keep, cancel)
+      except TimeoutError:
+        fn = None # Cancelled while another alarm was synthesizing it
+      span.set(ok=fn is not None)
+    if cancel.is_set():
+      self._cleanup([fn])
+      return None
+    return fn
+
+  # Alarms in the same process saying the same thing with the same voice
+  # within [main] share_window seconds synthesize it once
+  def _cached_chunk(self, text, ramdrive, keep, cancel=None):
+    key = self.cache.key(self.__class__.__name__, self.voice(), text)
+    if keep:
+      return self._synth_chunk(text, ramdrive, keep, key)
+    window = float(self.main.get('share_window', 60))
+    return renders.get(key, window,
+                       lambda: self._synth_chunk(text, ramdrive, keep, key),
+                       self._shareable, cancel=cancel)
+
+  # Audio that can be played by more than one alarm: not a file, which its
+  # owner removes once played (the next alarm gets its own from the cache)
+  def _shareable(self, fn):
+    return fn is None or isinstance(fn, alarmpi_audiodata)
+
+  def _synth_chunk(self, text, ramdrive, keep, key):
+    tail = self.sconfig['tail']
+    fn = self.cache.get(key, tail)
+    if fn is not None:
+      if self.debug:
+        print 'TTS cache hit: ' + text
+      try:
+        # Played under a name of our own, which eviction leaves alone
+        return self.cache.hold(fn, ramdrive)
+      except (IOError, OSError):
+        pass # Evicted just now: make it again
+
+    if self.streams and not keep:
+      data = self.render_data(text)
+      if not data:
+        return None
+      # We play from memory; a copy goes into the cache if it is on and this
+      # looks like something we say again (see alarmpi_ttscache.put_data)
+      self.cache.put_data(key, tail, data)
+      return alarmpi_audiodata(data)
+
+    tmfn = os.path.join(ramdrive, str(uuid.uuid4()) + tail)
+    if not self.render(text, tmfn) or not os.path.isfile(tmfn):
+      self._cleanup([tmfn])
+      return None
+    # The cache gets its own copy (or link) and we play ours, for the same
+    # reason
+    return self.cache.put(key, tail, tmfn, True)
+
+  # Where our audio files go when we need files: ramdrive if we were given
+  # one, otherwise [main] ramfldr
+  def _ramdrive(self, ramdrive=None):
+    return ramdrive or self.main.get('ramfldr', '/mnt/ram/')
+
+  # Remove the files we made, leaving the cache alone
+  def _cleanup(self, files):
+    for fn in files:
+      if not isinstance(fn, basestring) or self.cache.owns(fn):
+        continue
+      if self.debug:
+        print 'Removing ' + fn
+      try:
+        os.remove(fn)
+      except OSError:
+        pass
+
+# Synthesized audio that was never written to a file
+class alarmpi_audiodata:
+  def __init__(self, data):
+    self.data = data
+
+# Text being spoken by one engine.  Each feed() is split into pieces that
+# are synthesized in the background ('workers' at a time) while a thread
+# hands the finished ones to a stream on the engine's player (see
+# applayer.alarmpi_stream) in the order they were fed, so the first piece
+# can be heard while later ones are still being rendered (or even
+# written).  If the very first piece can't be synthesized or played the
+# stream gives up without having said anything, so that the caller can
+# hand everything it fed to another engine.
+class alarmpi_ttsstream:
+  def __init__(self, engine, ramdrive):
+    self.engine = engine
+    self.ramdrive = ramdrive
+    self.started = time.time()
+    # All of the text fed so far
+    self.text = []
+    # Pieces handed to the player, ones it says it played, and whether we
+    # gave up before playing any
+    self.played = 0
+    self.heard = 0
+    self.failed = False
+    self.cancel = threading.Event()
+    self.pool = ThreadPool(max(engine.workers(), 1))
+    self.renders = []
+    # The player's stream, once there is something to play
+    self.output = None
+    # Pending renders in play order; None once there are no more to come
+    self.queue = Queue.Queue()
+    self.player = threading.Thread(target=tracer.carry(self._play),
+                                   name='tts-player')
+    self.player.daemon = True
+    self.player.start()
+
+  # Queue text to be spoken after whatever was fed before it.  Returns
+  # False if the stream has given up.
+  def feed(self, text):
+    if self.failed:
+      return False
+    self.text.append(text)
+    engine = self.engine
+    for chunk in plan_chunks(engine.normalize(text), engine.chunk_limit):
+      render = self.pool.apply_async(tracer.carry(engine._render_chunk),
+                                     (chunk, self.ramdrive, False, self.cancel))
+      self.renders.append(render)
+      self.queue.put(render)
+    return True
+
+  # No more text: wait until everything fed has been played.  Returns True
+  # if anything was said.
+  def finish(self):
+    self.queue.put(None)
+    while self.player.is_alive():
+      self.player.join(1)
+    if self.output is not None and not self.output.close() and \
+       not self.heard:
+      # The player couldn't play any of it (it wouldn't start...)
+      self.failed = True
+    self.pool.close()
+    self.engine._stop(self.pool, self.renders, self.cancel)
+    self.engine.cache.flush()
+    return not self.failed
+
+  def _play(self):
+    engine = self.engine
+    while True:
+      render = self.queue.get()
+      if render is None:
+        break
+      try:
+        fn = render.get()
+      except Exception as e:
+        if engine.debug:
+          print engine.stype + ': ' + str(e)
+        fn = None
+      if fn is None:
+        if not self.played:
+          # Nothing said yet, so let the next engine have a go
+          self.failed = True
+          break
+        continue
+      # Add it to the stream behind the last piece and go straight on to the
+      # next one, so that the player never has to wait for us
+      try:
+        if self.output is None:
+          self.output = engine.player().stream(self.ramdrive,
+                                               engine.sconfig['tail'])
+        if isinstance(fn, alarmpi_audiodata):
+          self.output.write(fn.data, self._played(fn))
+        else:
+          self.output.writefile(fn, self._played(fn))
+      except Exception as e:
+        print engine.stype + ': could not play: ' + repr(e)
+        engine._cleanup([fn])
+        if not self.played:
+          self.failed = True
+          break
+        continue
+      self.played += 1
+
+  # What to do once the piece in fn has been played
+  def _played(self, fn):
+    queued = time.time()
+    def done(ok):
+      if ok:
+        self.heard += 1
+      tracer.record('playback', queued, time.time(),
+                    engine=self.engine.__class__.__name__, ok=ok)
+      self.engine._cleanup([fn])
+    return done
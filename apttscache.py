@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+# Keys of audio put_data() has seen, by cache folder, oldest first
+_seen = {}
+# Folders whose keys have changed since they were last written down
+_dirty = set()
+_seenlock = threading.Lock()
+# Keys remembered per folder
+SEEN = 4096
+
+# Content addressed store for synthesized speech.  Audio is kept per piece
+# of text, keyed on engine, voice and the normalized text, so phrases we say
+# every day (the end phrase, birthday defaults...) are only synthesized once.
+# The least recently used files are evicted once the folder grows past its
+# byte budget.  An optional second folder on disk survives reboots.
+class alarmpi_ttscache:
+  defaults = {
+    # Bytes of the ramdrive we are allowed to fill (0 turns the cache off)
+    'ttscache_size': 16 * 1024 * 1024,
+
+    # Folder for the persistent tier (empty means don't keep one)
+    'ttscache_persist': '',
+
+    # Bytes of disk the persistent tier may use
+    'ttscache_persist_size': 256 * 1024 * 1024,
+  }
+
+  def __init__(self, folder, budget, persist='', persist_budget=0,
+               debug=False):
+    self.folder = os.path.join(folder, 'ttscache', '')
+    self.budget = budget
+    self.persist = os.path.join(persist, '') if persist else ''
+    self.persist_budget = persist_budget
+    self.debug = debug
+
+  # Make a cache from the [main] items handed to a section
+  @classmethod
+  def from_main(cls, main, debug=False):
+    def option(o):
+      return main.get(o, cls.defaults[o])
+    return cls(main.get('ramfldr', '/mnt/ram/'),
+               int(option('ttscache_size')),
+               option('ttscache_persist'),
+               int(option('ttscache_persist_size')),
+               debug)
+
+  def enabled(self):
+    return self.budget > 0
+
+  # Only whitespace is evened out: engines say 'US' and 'us' differently
+  def key(self, engine, voice, text):
+    text = ' '.join(text.split())
+    return hashlib.sha1('\0'.join((engine, voice, text))).hexdigest()
+
+  # True if fn is one of our files (and so must not be deleted by the caller)
+  def owns(self, fn):
+    return self.enabled() and fn.startswith(self.folder)
+
+  # Returns the path of the cached audio for key, or None
+  def get(self, key, tail):
+    if not self.enabled():
+      return None
+    fn = self.folder + key + tail
+    try:
+      os.utime(fn, None) # Mark as recently used
+      return fn
+    except OSError:
+      pass
+    if self.persist and os.path.isfile(self.persist + key + tail):
+      if self.debug:
+        print 'TTS cache: loading ' + key + ' from ' + self.persist
+      try:
+        self._copy(self.persist + key + tail, fn)
+        self._evict(self.folder, self.budget)
+      except (IOError, OSError) as e:
+        print 'TTS cache: could not load ' + key + ': ' + str(e)
+        return None
+      return fn
+    return None
+
+  # Add the audio in src to the cache.  src is moved into the cache unless
+  # keep is set.  Returns the path the caller should use from now on.  The
+  # cache never costs us the audio: if it can't be stored, src is still
+  # there to be played.
+  def put(self, key, tail, src, keep=False):
+    if not self.enabled() or os.path.getsize(src) == 0:
+      return src
+    fn = self.folder + key + tail
+    try:
+      if keep:
+        self._copy(src, fn)
+      else:
+        self._makedirs(self.folder)
+        shutil.move(src, fn)
+    except (IOError, OSError) as e:
+      print 'TTS cache: could not store ' + key + ': ' + str(e)
+      return src
+    self._persist(key, tail, fn)
+    return src if keep else fn
+
+  # Add audio that is only in memory.  It is played from memory anyway, so
+  # it is only written to the cache the second time we see its key: what
+  # we say every day gets cached, but the news, which is new every day,
+  # never goes near the ramdrive.  Returns its path in the cache, or None
+  # if it wasn't cached.
+  def put_data(self, key, tail, data):
+    if not self.enabled() or not data or not self._again(key):
+      return None
+    fn = self.folder + key + tail
+    try:
+      self._write(data, fn)
+    except (IOError, OSError) as e:
+      print 'TTS cache: could not store ' + key + ': ' + str(e)
+      return None
+    self._persist(key, tail, fn)
+    return fn
+
+  # Copy fn, just stored for key, to the persistent tier if it is on, and
+  # keep both tiers in budget.  Failing to is only worth a message.
+  def _persist(self, key, tail, fn):
+    try:
+      if self.persist and not os.path.isfile(self.persist + key + tail):
+        self._copy(fn, self.persist + key + tail)
+        self._evict(self.persist, self.persist_budget)
+      self._evict(self.folder, self.budget, fn)
+    except (IOError, OSError) as e:
+      print 'TTS cache: ' + str(e)
+
+  # Write down the keys put_data() has seen, for the next run to find (one
+  # write for everything a run said, not one per piece)
+  def flush(self):
+    with _seenlock:
+      if self.folder not in _dirty:
+        return
+      _dirty.discard(self.folder)
+      text = ''.join(key + '\n' for key in _seen[self.folder])
+    try:
+      self._write(text, self.folder + '.seen')
+    except (IOError, OSError) as e:
+      if self.debug:
+        print 'TTS cache: could not save seen keys: ' + str(e)
+
+  # True if put_data() has seen key before.  Remembers it either way.
+  def _again(self, key):
+    with _seenlock:
+      if self.folder not in _seen:
+        seen = _seen[self.folder] = OrderedDict()
+        try:
+          with open(self.folder + '.seen') as f:
+            for line in f:
+              seen[line.strip()] = True
+        except IOError:
+          pass
+      seen = _seen[self.folder]
+      if key in seen:
+        return True
+      seen[key] = True
+      while len(seen) > SEEN:
+        seen.popitem(False)
+      _dirty.add(self.folder)
+      return False
+
+  # A name of our own in folder for fn, a file get() returned, so that
+  # evicting it can't take it away before it is played.  The caller
+  # removes it once done with it.
+  def hold(self, fn, folder):
+    tmfn = os.path.join(folder, str(uuid.uuid4()) + os.path.splitext(fn)[1])
+    self._link(fn, tmfn)
+    return tmfn
+
+  # Copy so that readers never see a half written file
+  def _copy(self, src, dst):
+    folder = os.path.dirname(dst)
+    self._makedirs(folder)
+    tmpfn = os.path.join(folder, '.' + str(uuid.uuid4()))
+    self._link(src, tmpfn)
+    os.rename(tmpfn, dst)
+
+  # A second name for src if they are on the same filesystem (files in the
+  # cache are only ever replaced, never written to), otherwise a copy
+  def _link(self, src, dst):
+    try:
+      os.link(src, dst)
+    except OSError:
+      shutil.copyfile(src, dst)
+
+  def _write(self, data, dst):
+    folder = os.path.dirname(dst)
+    self._makedirs(folder)
+    tmpfn = os.path.join(folder, '.' + str(uuid.uuid4()))
+    try:
+      with open(tmpfn, 'wb') as f:
+        f.write(data)
+      os.rename(tmpfn, dst)
+    except (IOError, OSError):
+      # Out of room, most likely: don't leave half of it behind
+      try:
+        os.remove(tmpfn)
+      except OSError:
+        pass
+      raise
+
+  # Our folders in ramfldr are made inside it, but ramfldr itself never
+  # is: if the ramdrive isn't mounted we must not fill the SD card instead.
+  # The persistent tier is on disk anyway.
+  def _makedirs(self, folder):
+    try:
+      if os.path.join(folder, '') == self.folder:
+        os.mkdir(folder)
+      else:
+        os.makedirs(folder)
+    except OSError:
+      if not os.path.isdir(folder):
+        raise
+
+  # Delete the least recently used files until folder fits in budget
+  def _evict(self, folder, budget, keep=None):
+    files = []
+    total = 0
+    for name in os.listdir(folder):
+      if name.startswith('.'):
+        continue # Still being written
+      fn = os.path.join(folder, name)
+      try:
+        st = os.stat(fn)
+      except OSError:
+        continue # Somebody else evicted it
+      files.append((st.st_mtime, st.st_size, fn))
+      total += st.st_size
+    files.sort()
+    for mtime, size, fn in files:
+      if total <= budget:
+        break
+      if fn == keep:
+        continue
+      if self.debug:
+        print 'TTS cache: evicting ' + fn
+      try:
+        os.remove(fn)
+      except OSError:
+        pass
+      total -= size
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Times a whole alarm without a network, a speaker or a Pi.
+#
+# The content sources are pointed at a stub HTTP server that serves canned
+# answers (bench/fixtures/), the TTS engines and players are replaced by
+# the fake ones next to this file, and sound_the_alarm.py is run for real
+# against the rewritten config.  For every run we report
+#
+#   ttfa   seconds from starting the alarm until the first audio played
+#   total  seconds until the alarm exited
+#   rss    peak resident memory of the alarm process
+#
+#   python bench/benchmark.py --runs 5
+#   python bench/benchmark.py --delay news=1.5 --fail stocks=0.5 alarm.config
+import argparse
+import BaseHTTPServer
+import ConfigParser
+import json
+import os
+import random
+import shutil
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+CODEDIR = os.path.dirname(BENCHDIR)
+FIXTURES = os.path.join(BENCHDIR, 'fixtures')
+
+# What the stub serves: (route name, part of the path it matches, fixture)
+ROUTES = [
+  ('weather', 'weather.forecast', 'weather.json'),
+  ('stocks', 'yahoo.finance.quote', 'stocks.json'),
+  ('btc', '/api/v1/prices', 'btc.json'),
+  ('news', 'rss', 'rss.xml'),
+  ('tts', 'translate_tts', 'tts.mp3'),
+]
+
+# Sections that fetch over http and so have to be sent to the stub
+WEB = ('weather_yahoo', 'stocks', 'btc', 'news', 'trygoogle')
+
+class stubserver(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+  def __init__(self, delays, failures):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), stubhandler)
+    self.delays = delays
+    self.failures = failures
+    self.bodies = {}
+    for name, match, fixture in ROUTES:
+      with open(os.path.join(FIXTURES, fixture), 'rb') as f:
+        self.bodies[name] = f.read()
+
+  def route(self, path):
+    for name, match, fixture in ROUTES:
+      if match in path:
+        return name
+    return None
+
+class stubhandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    name = self.server.route(self.path)
+    if name is None:
+      return self._send(404, 'text/plain', 'No fixture for ' + self.path)
+    time.sleep(self.server.delays.get(name, 0))
+    if random.random() < self.server.failures.get(name, 0):
+      return self._send(503, 'text/plain', 'Injected failure')
+    kind = 'audio/mpeg' if name == 'tts' else 'application/json'
+    if name == 'news':
+      kind = 'application/rss+xml'
+    self._send(200, kind, self.server.bodies[name])
+
+  def _send(self, status, kind, body):
+    self.send_response(status)
+    self.send_header('Content-Type', kind)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+# Parse name=value options into {name: float}
+def _pairs(values, what):
+  pairs = {}
+  for value in values or []:
+    name, sep, number = value.partition('=')
+    if not sep or name not in [r[0] for r in ROUTES]:
+      raise SystemExit('Bad ' + what + ' "' + value + '": use one of ' +
+                       ', '.join(r[0] for r in ROUTES) + '=<number>')
+    pairs[name] = float(number)
+  return pairs
+
+# Copy of configfile that runs against the stub and the fakes in workdir
+def rewrite(configfile, workdir, port, effects):
+  config = ConfigParser.RawConfigParser()
+  config.read(configfile)
+  ramfldr = os.path.join(workdir, 'ram') + '/'
+  config.set('main', 'debug', '0')
+  config.set('main', 'readaloud', '1')
+  config.set('main', 'ramfldr', ramfldr)
+  config.set('main', 'statefldr', os.path.join(workdir, 'state') + '/')
+  hosts = ['127.0.0.1']
+  config.set('main', 'nthost', ','.join(hosts))
+  config.set('main', 'netcache', '86400')
+  for section in config.sections():
+    if section == 'main' or not config.has_option(section, 'stype'):
+      continue
+    stype = config.get(section, 'stype')
+    if stype == 'effect' and not effects:
+      config.set(section, 'enabled', '0')
+    if section == 'light':
+      config.set(section, 'backend', 'mock')
+      config.set(section, 'socket', os.path.join(workdir, 'light.sock'))
+    if section in WEB:
+      config.set(section, 'host', '127.0.0.1:' + str(port))
+      config.set(section, 'scheme', 'http')
+    if stype == 'tts':
+      player = config.get(section, 'player') if \
+               config.has_option(section, 'player') else ''
+      if player.startswith('mpg123'):
+        # Named so that applayer drives it like the real mpg123
+        player = os.path.join(workdir, 'bin', 'mpg123')
+      else:
+        player = os.path.join(BENCHDIR, 'fakeplayer.py')
+      config.set(section, 'player', player)
+      if section == 'trygoogle':
+        config.set(section, 'head', os.path.join(BENCHDIR, 'fakehead.py'))
+      elif section == 'trypico2wave':
+        config.set(section, 'head', os.path.join(BENCHDIR, 'fakepico.py'))
+  fn = os.path.join(workdir, os.path.basename(configfile))
+  with open(fn, 'w') as f:
+    config.write(f)
+
+  bindir = os.path.join(workdir, 'bin')
+  if not os.path.isdir(bindir):
+    os.makedirs(bindir)
+    os.symlink(os.path.join(BENCHDIR, 'fakeplayer.py'),
+               os.path.join(bindir, 'mpg123'))
+
+  # The alarm resolves its net hosts before anything else; tell it the
+  # answer is already known instead of needing DNS
+  if not os.path.isdir(ramfldr):
+    os.makedirs(ramfldr)
+  with open(os.path.join(ramfldr, 'netstate.json'), 'w') as f:
+    json.dump({'hosts': hosts, 'time': time.time(), 'netup': True}, f)
+  return fn
+
+# Run the alarm once; returns {'ttfa', 'total', 'rss'}
+def runonce(configfile, workdir, clip):
+  log = os.path.join(workdir, 'played.log')
+  if os.path.exists(log):
+    os.remove(log)
+  env = dict(os.environ)
+  env['ALARMPI_BENCH_LOG'] = log
+  env['ALARMPI_BENCH_CLIP'] = str(clip)
+  with open(os.devnull, 'w') as devnull:
+    start = time.time()
+    proc = subprocess.Popen([sys.executable,
+                             os.path.join(CODEDIR, 'sound_the_alarm.py'),
+                             '--config', configfile],
+                            cwd=CODEDIR, env=env, stdout=devnull)
+    pid, status, usage = os.wait4(proc.pid, 0)
+    end = time.time()
+
+  ttfa = None
+  if os.path.exists(log):
+    with open(log) as f:
+      played = [float(line.split()[0]) for line in f if line.strip()]
+    if played:
+      ttfa = min(played) - start
+  return {
+    'ttfa': ttfa,
+    'total': end - start,
+    'rss': usage.ru_maxrss, # kB on Linux
+    'status': status,
+  }
+
+def _median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+def _summary(results, key, fmt):
+  values = [r[key] for r in results if r[key] is not None]
+  if not values:
+    return '%-6s %s' % (key, 'no audio played')
+  return ('%-6s min ' + fmt + '  median ' + fmt + '  max ' + fmt) % (
+    key, min(values), _median(values), max(values))
+
+def bench(configfile, args, server):
+  workdir = tempfile.mkdtemp(prefix='alarmpi-bench-')
+  try:
+    results = []
+    for run in range(args.runs):
+      if not args.warm and run:
+        # Start every run from cold caches, as after a reboot
+        for cache in ('ram', 'state'):
+          shutil.rmtree(os.path.join(workdir, cache), ignore_errors=True)
+      rewritten = rewrite(configfile, workdir, server.server_address[1],
+                          args.effects)
+      result = runonce(rewritten, workdir, args.clip)
+      results.append(result)
+      if args.verbose:
+        print '  run %d: ttfa %s  total %.3fs  rss %dkB%s' % (
+          run + 1,
+          '%.3fs' % result['ttfa'] if result['ttfa'] is not None else 'n/a',
+          result['total'], result['rss'],
+          '  exit status ' + str(result['status']) if result['status'] else '')
+  finally:
+    if args.keep:
+      print '  work files kept in ' + workdir
+    else:
+      shutil.rmtree(workdir, ignore_errors=True)
+
+  print configfile + ' (' + str(len(results)) + ' runs' + \
+        (', warm' if args.warm else '') + ')'
+  print '  ' + _summary(results, 'ttfa', '%7.3fs')
+  print '  ' + _summary(results, 'total', '%7.3fs')
+  print '  ' + _summary(results, 'rss', '%6dkB')
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Time an alarm offline')
+  parser.add_argument('configs', nargs='*',
+                      default=['alarm.config',
+                               os.path.join('config-examples', 'multi.config')],
+                      help='config files to time (relative to the code folder)')
+  parser.add_argument('--runs', type=int, default=3,
+                      help='times to run each config')
+  parser.add_argument('--warm', action='store_true',
+                      help='keep the caches between runs')
+  parser.add_argument('--effects', action='store_true',
+                      help='leave the effects (light, music) enabled')
+  parser.add_argument('--delay', action='append', metavar='ROUTE=SECONDS',
+                      help='make the stub slow to answer a route')
+  parser.add_argument('--fail', action='append', metavar='ROUTE=CHANCE',
+                      help='make the stub fail a route some of the time')
+  parser.add_argument('--clip', type=float, default=0.05,
+                      help='seconds the fake player spends on each file')
+  parser.add_argument('--seed', type=int, default=None,
+                      help='seed for the injected failures')
+  parser.add_argument('--keep', action='store_true',
+                      help='keep the rewritten configs and work files')
+  parser.add_argument('-v', '--verbose', action='store_true',
+                      help='print every run')
+  args = parser.parse_args(argv)
+  random.seed(args.seed)
+
+  server = stubserver(_pairs(args.delay, 'delay'), _pairs(args.fail, 'fail'))
+  thread = threading.Thread(target=server.serve_forever, name='stub')
+  thread.daemon = True
+  thread.start()
+  try:
+    for configfile in args.configs:
+      bench(os.path.join(CODEDIR, configfile), args, server)
+  finally:
+    server.shutdown()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Stands in for 'wget' in the trygoogle section: fetches the url from the
+# benchmark's stub server and saves it where -O says ('-' for stdout).
+import sys
+import urllib2
+
+def main(argv):
+  url = [a for a in argv if a.startswith('http')][0]
+  out = argv[argv.index('-O') + 1]
+  try:
+    body = urllib2.urlopen(url, timeout=10).read()
+  except Exception as e:
+    sys.stderr.write('fakehead: ' + str(e) + '\n')
+    return 8 # What wget says for a server error
+  if out == '-':
+    sys.stdout.write(body)
+    return 0
+  with open(out, 'wb') as f:
+    f.write(body)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
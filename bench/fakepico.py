@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Stands in for pico2wave: writes a short silent wav after taking about as
+# long as pico2wave does on a Pi for the same text.
+import sys
+import time
+import wave
+
+SECONDS_PER_CHAR = 0.002
+
+def main(argv):
+  out = argv[argv.index('-w') + 1]
+  text = argv[-1]
+  time.sleep(len(text) * SECONDS_PER_CHAR)
+  w = wave.open(out, 'wb')
+  w.setnchannels(1)
+  w.setsampwidth(2)
+  w.setframerate(16000)
+  w.writeframes('\0\0' * 1600)
+  w.close()
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Stands in for mpg123/aplay: notes in $ALARMPI_BENCH_LOG when each file
+# starts "playing", then pretends to play it for a moment.  With -R it
+# speaks enough of mpg123's remote control protocol for applayer.
+import os
+import sys
+import time
+
+SECONDS_PER_FILE = float(os.environ.get('ALARMPI_BENCH_CLIP', '0.05'))
+
+def play(fn):
+  if fn == '-':
+    played(fn, sys.stdin) # Audio handed to us on stdin
+  else:
+    with open(fn, 'rb') as f:
+      played(fn, f)
+  time.sleep(SECONDS_PER_FILE)
+
+# Sound starts with the first bytes, not once the writer is done: a named
+# pipe is drained like the real thing would, and may be written into for
+# as long as it is being played
+def played(fn, f):
+  os.read(f.fileno(), 4096)
+  log = os.environ.get('ALARMPI_BENCH_LOG')
+  if log:
+    with open(log, 'a') as logfile:
+      logfile.write('%.6f play %s\n' % (time.time(), fn))
+  while os.read(f.fileno(), 4096):
+    pass
+
+def remote():
+  say('@R MPG123 (fake) v10')
+  for line in iter(sys.stdin.readline, ''):
+    words = line.split(None, 1)
+    if not words:
+      continue
+    command = words[0].upper()
+    if command in ('LOAD', 'L'):
+      try:
+        say('@P 2')
+        say('@S 1.0 3 44100 Mono 0 417 1 0 0 0 128 0 1')
+        play(words[1].strip())
+        say('@P 0')
+      except IOError as e:
+        say('@E ' + str(e))
+    elif command == 'SAMPLE':
+      say('@SAMPLE 0 0')
+    elif command in ('QUIT', 'Q'):
+      break
+
+def say(line):
+  sys.stdout.write(line + '\n')
+  sys.stdout.flush()
+
+def main(argv):
+  if '-R' in argv:
+    return remote()
+  for fn in [a for a in argv if a == '-' or not a.startswith('-')]:
+    play(fn)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
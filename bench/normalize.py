@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Compares utilities.normalizeText with the chain of replaces in
+# utilities.stripSymbols on a morning's worth of text.
+#
+#   python bench/normalize.py --number 2000
+#
+# normalizeText is checked against FIXTURES first.
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utilities
+
+SAMPLE = (
+  "Good morning, Peter it's Saturday October seventeenth, 07 33 AM.   "
+  "The weather is Mostly Cloudy, currently 12 degrees with a high of 15 "
+  "& a low of -3.  Wind chill 46 at 14.48 km/h.   "
+  "Stock update: Facebook is trading at $312.48 (+0.7%).  Port of Tauranga "
+  "is trading at $6.91, down 0.6%, after a $1,000.5 fine.   "
+  "The value of 1 bitcoin is: $61,234.57.   "
+  "And now, The latest stories from the World section of the BBC News.  "
+  "Leaders meet for climate talks in Geneva.  Negotiators from nearly 200 "
+  "countries gather to agree new emissions targets, e.g. a 45% cut.  "
+  "Mr. Smith vs. Dr. Jones: the #1 question @ the summit is \"who pays\".   "
+  "Thats all for now.  Have a nice day.")
+
+# (text, what normalizeText should make of it)
+FIXTURES = [
+  ("$312.48 (+0.7%)", "312 dollars and 48 cents (plus 0.7 percent)"),
+  ("a $1,000.5 fine", "a 1000 dollars and 50 cents fine"),
+  ("$12.345", "12.345 dollars"),
+  ("BTC is at $0.00042 per satoshi.", "BTC is at 0.00042 dollars per satoshi."),
+  ("Shares in Apple Inc.", "Shares in Apple Incorporated."),
+  ("Shares in Apple Inc. Fell today.",
+   "Shares in Apple Incorporated. Fell today."),
+  ("Acme Ltd.   The weather", "Acme Limited.   The weather"),
+  ("Apple Inc., Google and Acme Corp. all",
+   "Apple Incorporated, Google and Acme Corporation all"),
+  ("Mr. Smith vs. Dr. Jones", "Mister Smith versus Doctor Jones"),
+  ("x=$3.999", "x equals 3.999 dollars"),
+  ("up 5%=$2", "up 5 percent equals 2 dollars"),
+]
+
+# Returns the number of fixtures normalizeText gets wrong
+def check():
+  wrong = 0
+  for text, expected in FIXTURES:
+    got = utilities.normalizeText(text)
+    if got != expected:
+      wrong += 1
+      print 'FAIL %r\n  got      %r\n  expected %r' % (text, got, expected)
+  print '%d of %d fixtures ok' % (len(FIXTURES) - wrong, len(FIXTURES))
+  return wrong
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Time the TTS text normalizer')
+  parser.add_argument('--number', type=int, default=2000,
+                      help='times to normalize the sample per measurement')
+  parser.add_argument('--repeat', type=int, default=5,
+                      help='measurements to take the best of')
+  args = parser.parse_args(argv)
+
+  if check():
+    return 1
+  print
+  print 'Sample: %d characters' % len(SAMPLE)
+  results = []
+  for name in ('stripSymbols', 'normalizeText'):
+    function = getattr(utilities, name)
+    best = min(timeit.repeat(lambda: function(SAMPLE), number=args.number,
+                             repeat=args.repeat))
+    results.append(best)
+    print '  %-14s %8.2fus per call' % (name, best / args.number * 1e6)
+  print '  normalizeText does more and takes %.2fx the time' % (
+    results[1] / results[0])
+  print
+  print 'stripSymbols:  ' + utilities.stripSymbols(SAMPLE)
+  print
+  print 'normalizeText: ' + utilities.normalizeText(SAMPLE)
+
+if __name__ == '__main__':
+  sys.exit(main())
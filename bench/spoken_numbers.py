@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Times better_spoken_numbers against the recursive n2w it replaced.
+#
+#   python bench/spoken_numbers.py --count 20000
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import better_spoken_numbers as bsn
+
+# The old n2w, for comparison (it stopped at a billion)
+def legacy_n2w(n):
+  num2words = bsn.num2words
+  if n<=20:
+    return num2words[n]
+  elif n<100:
+    words=num2words[n-n%10]
+    if n%10>0:
+      words+=num2words[n%10]
+    return words
+  elif n<1000:
+    hundreds=(n-n%100)/100
+    tens=(n%100)-(n%100)%10
+    singles=n-((hundreds*100)+tens)
+    words=num2words[hundreds] + ' hundred'
+    if tens > 0:
+      words+=' '+num2words[tens]
+    if singles > 0:
+      words+=num2words[singles]
+    return words
+  elif n<1000000:
+    thousands=(n-n%1000)/1000
+    remainder=n-(thousands*1000)
+    words=legacy_n2w(thousands)+' thousand'
+    if remainder>0:
+      words+=' '+legacy_n2w(remainder)
+    return words
+  elif n<1000000000:
+    millions=(n-n%1000000)/1000000
+    remainder=n-(millions*1000000)
+    words=legacy_n2w(millions)+' million'
+    if remainder>0:
+      words+=' '+legacy_n2w(remainder)
+    return words
+  else:
+    return 'Number out of range'
+
+def _time(label, function, count, repeat):
+  best = min(timeit.repeat(function, number=1, repeat=repeat))
+  print '  %-28s %8.2fus per number' % (label, best / count * 1e6)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Time the number verbalizer')
+  parser.add_argument('--count', type=int, default=20000,
+                      help='numbers per measurement')
+  parser.add_argument('--repeat', type=int, default=5,
+                      help='measurements to take the best of')
+  args = parser.parse_args(argv)
+
+  random.seed(1)
+  numbers = [random.randint(0, 999999999) for i in range(args.count)]
+  # Prices repeat a lot across a watch list and from day to day
+  prices = [round(random.uniform(1, 500), 2) for i in range(args.count // 20)]
+  prices = [random.choice(prices) for i in range(args.count)]
+
+  print '%d whole numbers below a billion:' % args.count
+  _time('legacy n2w', lambda: [legacy_n2w(n) for n in numbers],
+        args.count, args.repeat)
+  bsn._segments.clear()
+  _time('n2w, first call (cold)', lambda: [bsn.n2w(n) for n in numbers],
+        args.count, 1)
+  _time('n2w, segments memoized', lambda: [bsn.n2w(n) for n in numbers],
+        args.count, args.repeat)
+  _time('batch(n2w)', lambda: bsn.batch(numbers), args.count, args.repeat)
+
+  print '%d prices with repeats:' % args.count
+  def legacy_prices():
+    for price in prices:
+      whole = int(price)
+      cents = int(round((price - whole) * 100))
+      words = legacy_n2w(whole) + ' dollars'
+      if cents:
+        words += ' and ' + legacy_n2w(cents) + ' cents'
+  _time('legacy dollars and cents', legacy_prices, args.count, args.repeat)
+  _time('currency', lambda: [bsn.currency(p) for p in prices],
+        args.count, args.repeat)
+  _time('batch(currency)', lambda: bsn.batch(prices, bsn.currency),
+        args.count, args.repeat)
+
+if __name__ == '__main__':
+  main()
@@ -1,13 +1,13 @@
 #!/usr/bin/python
-from math import floor
+from decimal import Decimal
 
-num2words = {0: 'Zero ', 1: 'One ', 2: 'Two ', 3: 'Three ', 4: 'Four ', 5: 'Five ',
-             6: 'Six ', 7: 'Seven ', 8: 'Eight ', 9: 'Nine ', 10: 'Ten ',
-            11: 'Eleven ', 12: 'Twelve ', 13: 'Thirteen ', 14: 'Fourteen ',
-            15: 'Fifteen ', 16: 'Sixteen ', 17: 'Seventeen ', 18: 'Eighteen ',
-            19: 'Nineteen ', 20: 'Twenty ', 30: 'Thirty ', 40: 'Forty ',
-            50: 'Fifty ', 60: 'Sixty ', 70: 'Seventy ', 80: 'Eighty ',
-            90: 'Ninety '}
+num2words = {0: 'Zero', 1: 'One', 2: 'Two', 3: 'Three', 4: 'Four', 5: 'Five',
+             6: 'Six', 7: 'Seven', 8: 'Eight', 9: 'Nine', 10: 'Ten',
+            11: 'Eleven', 12: 'Twelve', 13: 'Thirteen', 14: 'Fourteen',
+            15: 'Fifteen', 16: 'Sixteen', 17: 'Seventeen', 18: 'Eighteen',
+            19: 'Nineteen', 20: 'Twenty', 30: 'Thirty', 40: 'Forty',
+            50: 'Fifty', 60: 'Sixty', 70: 'Seventy', 80: 'Eighty',
+            90: 'Ninety'}
 
 date2words = {1: 'First', 2: 'Second', 3: 'Third', 4: 'Fourth', 5: 'Fifth',
             6: 'Sixth', 7: 'Seventh', 8: 'Eighth', 9: 'Ninth', 10: 'Tenth',
@@ -15,48 +15,155 @@ date2words = {1: 'First', 2: 'Second', 3: 'Third', 4: 'Fourth', 5: 'Fifth',
            15: 'Fifteenth', 16: 'Sixteenth', 17: 'Seventeenth', 18: 'Eighteenth',
            19: 'Nineteenth', 20: 'Twentieth', 30: 'Thirtieth'}
 
-def n2w(n):
-  if n<=20:
-    return num2words[n]
-  elif n<100:
-    words=num2words[n-n%10]
-    if n%10>0:
-      words+=num2words[n%10]
-    return words
-  elif n<1000:
-    hundreds=(n-n%100)/100
-    tens=(n%100)-(n%100)%10
-    singles=n-((hundreds*100)+tens)
-    words=num2words[hundreds] + ' hundred'
-    if tens > 0:
-      words+=' '+num2words[tens]
-    if singles > 0:
-      words+=num2words[singles]
-    return words
-  elif n<1000000:
-    thousands=(n-n%1000)/1000
-    remainder=n-(thousands*1000)
-    words=n2w(thousands)+' thousand'
-    if remainder>0:
-      words+=' '+n2w(remainder)
-    return words
-  elif n<1000000000:
-    millions=(n-n%1000000)/1000000
-    remainder=n-(millions*1000000)
-    words=n2w(millions)+' million'
-    if remainder>0:
-      words+=' '+n2w(remainder)
-    return words
-  else:
-    return 'Number out of range'
+# Ordinals of the words a number can end with, other than the ones above
+ordinal2words = {'Forty': 'Fortieth', 'Fifty': 'Fiftieth', 'Sixty': 'Sixtieth',
+                 'Seventy': 'Seventieth', 'Eighty': 'Eightieth',
+                 'Ninety': 'Ninetieth', 'Zero': 'Zeroth'}
 
-def d2w(n):
+# Each one is a thousand times the one before.  Numbers too big for the
+# last one say it more than once ('thousand decillion').
+scales = ['', 'thousand', 'million', 'billion', 'trillion', 'quadrillion',
+          'quintillion', 'sextillion', 'septillion', 'octillion', 'nonillion',
+          'decillion']
+
+# (one, many, one hundredth, many hundredths)
+currencies = {
+  'dollar': ('dollar', 'dollars', 'cent', 'cents'),
+  'pound': ('pound', 'pounds', 'penny', 'pence'),
+  'euro': ('euro', 'euros', 'cent', 'cents'),
+}
+
+# The last word of a number -> the last word of its ordinal
+_ordinals = dict((num2words[n], date2words[n]) for n in date2words)
+_ordinals.update(ordinal2words)
+
+# Words for 0-999, worked out the first time each one is needed
+_segments = {}
+
+def _segment(n):
   try:
-    return date2words[n]
+    return _segments[n]
   except KeyError:
-    try:
-      return num2words[n-n%10] + date2words[n%10]
-    except KeyError:
-      return 'Date out of range'
+    pass
+  hundreds, rest = divmod(n, 100)
+  words = []
+  if hundreds:
+    words.append(num2words[hundreds] + ' hundred')
+  if rest in num2words and (rest or not hundreds):
+    words.append(num2words[rest])
+  elif rest:
+    tens, singles = divmod(rest, 10)
+    words.append(num2words[tens * 10] + ' ' + num2words[singles])
+  _segments[n] = words = ' '.join(words)
+  return words
+
+# Anything this big is counted in decillions
+_biggest = 1000 ** len(scales)
+
+# Words for a whole number of any size
+def _whole(n):
+  if n < 1000:
+    if n < 0:
+      return 'Minus ' + _whole(-n)
+    return _segment(n)
+  if n >= _biggest:
+    # Out of names: count in units of the biggest one
+    high, low = divmod(n, _biggest // 1000)
+    words = _whole(high) + ' ' + scales[-1]
+    return words + (' ' + _whole(low) if low else '')
+  words = []
+  for scale in scales:
+    n, segment = divmod(n, 1000)
+    if segment:
+      if scale:
+        words.append(_segment(segment) + ' ' + scale)
+      else:
+        words.append(_segment(segment))
+    if not n:
+      break
+  words.reverse()
+  return ' '.join(words)
 
+# A number as a plain string of digits, without an exponent
+def _digits(n):
+  if isinstance(n, float):
+    n = repr(n)
+    if 'e' not in n:
+      return n
+  if isinstance(n, (float, Decimal)) or 'e' in str(n).lower():
+    return '{0:f}'.format(Decimal(str(n)))
+  return str(n).strip()
+
+# Words for n: an int, a float, a Decimal or a string of digits, with a
+# sign and a fractional part if it has them ('Three point One Four')
+def n2w(n):
+  if isinstance(n, (int, long)):
+    return _whole(n)
+  text = _digits(n)
+  sign = ''
+  if text.startswith('-'):
+    sign, text = 'Minus ', text[1:]
+  whole, point, fraction = text.partition('.')
+  words = sign + _whole(int(whole or '0'))
+  if fraction.strip('0'):
+    words += ' point ' + ' '.join(num2words[int(d)] for d in fraction)
+  return words
+
+# Ordinal words for a whole number ('Twenty First', 'One hundredth')
+def ordinal(n):
+  head, space, last = _whole(n).rpartition(' ')
+  return head + space + _ordinals.get(last, last + 'th')
+
+# The day of the month, in words
+def d2w(n):
+  return ordinal(n)
+
+# An amount of money, rounded to the nearest hundredth:
+# 'Sixty One thousand Two hundred Thirty Four dollars and Fifty Seven cents'
+def currency(amount, unit='dollar'):
+  one, many, minor_one, minor_many = currencies[unit]
+  # Round the digits as written, so that 0.57 can't turn into 56 cents
+  text = _digits(amount)
+  sign = ''
+  if text.startswith('-'):
+    sign, text = 'Minus ', text[1:]
+  whole, point, fraction = text.partition('.')
+  whole = int(whole or '0')
+  cents = int((fraction + '00')[:2])
+  if fraction[2:3] >= '5':
+    cents += 1
+    if cents == 100:
+      whole, cents = whole + 1, 0
+  if not whole and not cents:
+    sign = ''
+  words = sign + _whole(whole) + ' ' + (one if whole == 1 else many)
+  if cents:
+    words += ' and ' + _segment(cents) + ' ' + \
+             (minor_one if cents == 1 else minor_many)
+  return words
+
+# A time of day: 'Seven oh Five AM', or 'Nineteen Thirty' on a 24 hour clock
+def clock(hour, minute=0, twelve=True):
+  if twelve:
+    words = _whole((hour + 11) % 12 + 1)
+  else:
+    words = _whole(hour)
+  if minute:
+    words += ' ' + ('oh ' if minute < 10 else '') + _whole(minute)
+  elif not twelve:
+    words += ' hundred'
+  if twelve:
+    words += ' AM' if hour < 12 else ' PM'
+  return words
 
+# Words for many values at once.  Values that come up more than once are
+# only worked out once.
+def batch(values, verbalize=n2w, **options):
+  done = {}
+  words = []
+  for value in values:
+    key = (type(value), value)
+    if key not in done:
+      done[key] = verbalize(value, **options)
+    words.append(done[key])
+  return words
@@ -6,6 +6,8 @@ import better_spoken_numbers as bsn
 from apcontent import alarmpi_content
 
 class birthday(alarmpi_content):
+  # Depends on the day
+  clock = '%Y%m%d'
 
   def build(self):
     birthday = None
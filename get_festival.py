@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import socket
+import StringIO
+import subprocess
+import threading
+import time
+import wave
+
+from aptts import alarmpi_tts
+
+# Speaks through a 'festival --server' that stays up between alarms, so
+# that festival's voices and lexicons are loaded once instead of on every
+# call to 'festival --tts'.  If nothing answers on host:port and host is
+# this machine, the server is started (and left running for next time).
+# Text is sent a few sentences at a time and each piece is played as soon
+# as its audio comes back, while later pieces are still being synthesized.
+#
+#   [festival]
+#   stype=tts
+#   host=localhost
+#   port=1314
+#   server=festival --server
+#   player=aplay -q
+class festival(alarmpi_tts):
+  # Short pieces, so that the first sentence is heard straight away
+  chunk_limit = 200
+  streams = True
+
+  def __init__(self, stype, sconfig, debug, main):
+    alarmpi_tts.__init__(self, stype, sconfig, debug, main)
+    self.sconfig.setdefault('tail', '.wav')
+    self.sconfig.setdefault('player', 'aplay -q')
+
+  def stream(self, ramdrive=None):
+    if self.debug:
+      print "Trying the festival server."
+    return alarmpi_tts.stream(self, ramdrive)
+
+  def voice(self):
+    return self.sconfig.get('voice', '')
+
+  # The server synthesizes one piece at a time
+  def workers(self):
+    return int(self.sconfig.get('fetchers', 1))
+
+  def render_data(self, text):
+    try:
+      return self._server().say(text, self.sconfig.get('voice'))
+    except (IOError, ValueError, wave.Error) as e:
+      if self.debug:
+        print 'festival server: ' + str(e)
+      return None
+
+  def _server(self):
+    return server(self.sconfig.get('host', 'localhost'),
+                  int(self.sconfig.get('port', 1314)),
+                  self.sconfig.get('server', 'festival --server'),
+                  float(self.sconfig.get('timeout', 30)),
+                  self.debug)
+
+# Ends every block of data the server sends
+KEY = 'ft_StUfF_key'
+
+# Talks festival's server protocol: we send Scheme, and it answers each
+# command with 'WV\n' + a waveform (one per utterance, with
+# tts_return_to_client), 'LP\n' + a Lisp value, then 'OK\n', or 'ER\n' if
+# the command failed.  Blocks of data end with KEY.
+class alarmpi_festivalserver:
+  def __init__(self, host, port, command, timeout=30, debug=False):
+    self.host = host
+    self.port = port
+    self.command = command
+    self.timeout = timeout
+    self.debug = debug
+    self.lock = threading.Lock()
+
+  # A wav file (as a string) of festival saying text
+  def say(self, text, voice=None):
+    commands = ["(Parameter.set 'Wavefiletype 'riff)",
+                '(tts_return_to_client)']
+    if voice:
+      commands.append('(voice_' + voice + ')')
+    commands.append('(tts_textall "' + quote(text) + '" "nil")')
+    client = self._connect()
+    try:
+      client.sendall('\n'.join(commands) + '\n')
+      waves = self._read(client, len(commands))
+    finally:
+      client.close()
+    if not waves:
+      raise ValueError('no audio for "' + text + '"')
+    return joinwaves(waves)
+
+  # The waveforms the server sent back for count commands
+  def _read(self, client, count):
+    waves = []
+    reader = _reader(client)
+    while count:
+      tag = reader.read(3)
+      if tag == 'OK\n':
+        count -= 1
+      elif tag == 'ER\n':
+        raise ValueError('festival could not do it')
+      elif tag == 'WV\n':
+        waves.append(reader.until(KEY))
+      elif tag == 'LP\n':
+        reader.until(KEY)
+      else:
+        raise ValueError('festival said ' + repr(tag))
+    return waves
+
+  # A connection to the server, starting it if nobody is listening
+  def _connect(self):
+    try:
+      return self._open()
+    except socket.error:
+      if self.host not in ('localhost', '127.0.0.1') or not self.command:
+        raise
+    with self.lock:
+      try:
+        return self._open() # Someone else started it while we waited
+      except socket.error:
+        pass
+      process = self._start()
+      deadline = time.time() + self.timeout
+      while True:
+        try:
+          return self._open()
+        except socket.error:
+          if process.poll() is not None:
+            raise IOError('"' + self.command + '" exited with status ' +
+                          str(process.returncode))
+          if time.time() > deadline:
+            raise
+          time.sleep(0.1)
+
+  def _open(self):
+    return socket.create_connection((self.host, self.port), self.timeout)
+
+  def _start(self):
+    if self.debug:
+      print 'Starting "' + self.command + '"'
+    with open(os.devnull, 'w') as devnull:
+      # In a session of its own, so that it outlives us and stays warm for
+      # the next alarm
+      return subprocess.Popen(self.command, shell=True, stdin=devnull,
+                              stdout=devnull, stderr=devnull,
+                              preexec_fn=os.setsid, close_fds=True)
+
+class _reader:
+  def __init__(self, client):
+    self.client = client
+    self.buffer = ''
+
+  def _more(self):
+    data = self.client.recv(65536)
+    if not data:
+      raise IOError('festival server hung up')
+    self.buffer += data
+
+  def read(self, n):
+    while len(self.buffer) < n:
+      self._more()
+    data, self.buffer = self.buffer[:n], self.buffer[n:]
+    return data
+
+  def until(self, end):
+    while end not in self.buffer:
+      self._more()
+    data, sep, self.buffer = self.buffer.partition(end)
+    return data
+
+# text as a Scheme string
+def quote(text):
+  return text.replace('\\', '\\\\').replace('"', '\\"')
+
+# One wav file made of several with the same format
+def joinwaves(waves):
+  if len(waves) == 1:
+    return waves[0]
+  out = StringIO.StringIO()
+  writer = None
+  for data in waves:
+    reader = wave.open(StringIO.StringIO(data))
+    if writer is None:
+      writer = wave.open(out, 'wb')
+      writer.setparams(reader.getparams())
+    writer.writeframes(reader.readframes(reader.getnframes()))
+  writer.close()
+  return out.getvalue()
+
+# One client per server, shared by everything in the process
+_servers = {}
+_lock = threading.Lock()
+
+def server(host, port, command, timeout=30, debug=False):
+  with _lock:
+    if (host, port) not in _servers:
+      _servers[(host, port)] = alarmpi_festivalserver(host, port, command,
+                                                      timeout, debug)
+    return _servers[(host, port)]
@@ -6,10 +6,14 @@ import better_spoken_numbers as bsn
 from apcontent import alarmpi_content
 
 class greeting(alarmpi_content):
+  # Says the time to the minute
+  clock = '%Y%m%d%H%M'
+
   def build(self):
     day_of_month=str(bsn.d2w(int(time.strftime("%d"))))
 
-    now = time.strftime("%A %B ") + day_of_month + ',' + time.strftime(" %I %M %p")
+    now = time.strftime("%A %B ") + day_of_month + ', ' + \
+          bsn.clock(int(time.strftime("%H")), int(time.strftime("%M")))
 
     if int(time.strftime("%H")) < 12:
       period = 'morning'
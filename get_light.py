@@ -1,18 +1,34 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import subprocess
-import time
-
+import aplight
 from apeffect import alarmpi_effect
 
+# Turns the light on when the alarm starts (fading it in over 'ramp'
+# seconds, if set) and off 'delay' seconds after it ends.  Neither waits:
+# the light has a thread of its own.
 class light(alarmpi_effect):
   def __init__(self, stype, sconfig, debug,main):
     alarmpi_effect.__init__(self, stype, sconfig, debug,main)
-    self.delay = int(self.sconfig['delay'])
+    self.delay = float(self.sconfig['delay'])
+    self.light = aplight.light(self.sconfig, debug)
+    self.socket = aplight.socketpath(self.sconfig, self.main)
 
   def begin(self):
-    print subprocess.call ('python lighton_1.py', shell=True)
+    ramp = float(self.sconfig.get('ramp', 0))
+    if ramp > 0:
+      self.light.ramp(ramp)
+    else:
+      self.light.on()
 
   def end(self):
-    time.sleep(self.delay)
-    print subprocess.call ('python lightoff_1.py', shell=True)
+    self.light.off_after(self.delay)
+
+  def stop(self):
+    self.light.off()
+
+  # Take commands from the web page (and lighton_1.py, lightoff_1.py) on
+  # the control socket, for as long as we run
+  def serve(self):
+    server = aplight.alarmpi_lightserver(self.light, self.socket, self.debug)
+    server.start()
+    return server
@@ -1,20 +1,73 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import subprocess
+import threading
 
+import aplibrary
+import applayer
 from apeffect import alarmpi_effect
 
 class music(alarmpi_effect):
-  # Don't do anything at the beginning
+  def __init__(self, stype, sconfig, debug, main):
+    alarmpi_effect.__init__(self, stype, sconfig, debug, main)
+    self.library = aplibrary.alarmpi_library.from_config(self.sconfig,
+                                                         self.main, debug)
+    self.thread = None
+    self.tracks = []
+    self.opened = None
+
+  # Pick the songs while we speak: bring the index up to date if it is
+  # older than 'rescan' seconds, pick them, and open the first one and get
+  # the player going so that the music starts the moment end() is called
   def begin(self):
-    pass
+    self.thread = threading.Thread(target=self._ready, name='music')
+    self.thread.daemon = True
+    self.thread.start()
 
-  # Play a song at the end
+  # Play the songs we picked (up to 'tracks' of them, default all) at the end
   def end(self):
-    print subprocess.call ('find '+
-                            self.sconfig['musicfldr'] +
-                            ' -name \'*' +
-                            self.sconfig['tail'] + '\' | sort --random-sort| ' +
-                            self.sconfig['player'],
-                            shell=True)
+    if self.thread is None:
+      self._ready()
+    else:
+      self.thread.join()
+      self.thread = None
+    tracks, self.tracks = self.tracks, []
+    if not tracks:
+      if self.debug:
+        print 'No music in ' + self.sconfig['musicfldr']
+      return
+    try:
+      print self._player().playfiles(tracks)
+    finally:
+      if self.opened is not None:
+        self.opened.close()
+        self.opened = None
+
+  # The music stops, and whatever was still to play with it
+  def stop(self):
+    self._player().stop()
+
+  def _player(self):
+    return applayer.player(self.sconfig['player'], self.debug)
 
+  def _ready(self):
+    try:
+      self.library.refresh(float(self.sconfig.get('rescan', 3600)))
+      filters = dict((tag, self.sconfig.get(tag))
+                     for tag in aplibrary.TAGS + ('path',))
+      self.tracks = self.library.pick(int(self.sconfig.get('tracks', 0)),
+                                      filters)
+    except Exception as e:
+      print 'Could not pick music: ' + repr(e)
+      self.tracks = []
+      return
+    if not self.tracks:
+      return
+    self._player().warm()
+    try:
+      # The first read wakes up a sleeping disk or NAS; the player's own
+      # read then comes from the page cache
+      self.opened = open(self.tracks[0], 'rb')
+      self.opened.read(256 * 1024)
+    except IOError as e:
+      if self.debug:
+        print 'Could not open ' + self.tracks[0] + ': ' + str(e)
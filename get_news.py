@@ -1,41 +1,91 @@
 #!/usr/bin/env python
 
-import feedparser
+import re
+from StringIO import StringIO
+from xml.etree import cElementTree
 
 from apcontent import alarmpi_content
+from apstore import alarmpi_store
 
 class news(alarmpi_content):
   def build(self):
     try:
       rss_url = 'http://' + self.sconfig['host'] + self.sconfig['path']
-      rss = feedparser.parse(rss_url)
-
-      #for entry in rss.entries[:4]:
-      #    print entry['title']
-      #    print entry['description']
-      #    
-      #print rss.entries[0]['title']
-      #print rss.entries[0]['description']
-      #print rss.entries[1]['title']
-      #print rss.entries[1]['description']
-      #print rss.entries[2]['title']
-      #print rss.entries[2]['description']
-      #print rss.entries[3]['title']
-      #print rss.entries[3]['description']
-
-      newsfeed = rss.entries[0]['title'] + '.  ' + rss.entries[0]['description'] + '.  ' + rss.entries[1]['title'] + '.  ' + rss.entries[1]['description'] + '.  ' + rss.entries[2]['title'] + '.  ' + rss.entries[2]['description'] + '.  ' + rss.entries[3]['title'] + '.  ' + rss.entries[3]['description'] + '.  ' 
+      items = int(self.sconfig.get('items', 4))
+
+      entries = self._entries(rss_url, items)
+      if len(entries) < items:
+        raise ValueError('Only ' + str(len(entries)) + ' stories in the feed')
+
+      newsfeed = ''
+      for title, description in entries:
+        newsfeed += title + '.  ' + description + '.  '
 
       # print newsfeed
       newsfeed = newsfeed.encode('utf-8')
 
       # Today's news from BBC
       news = 'And now, The latest stories from the World section of the BBC News.  ' + newsfeed
-        
 
-    except rss.bozo:
+
+    except Exception as e:
+      if self.debug:
+        print 'News: ' + repr(e)
       news = 'Failed to reach BBC News'
+      self.failed = True
 
     if self.debug:
       print news
 
     self.content = news
+
+  # The first items (title, description) pairs of the feed.  We remember
+  # them along with the feed's validators, and if the server says nothing
+  # changed we use those instead of downloading and parsing it again.
+  def _entries(self, rss_url, items):
+    store = alarmpi_store.from_main(self.main, self.debug)
+    name = 'news-' + store.key(rss_url)
+    cached = store.load(name)
+
+    headers = {}
+    if cached is not None and len(cached['entries']) >= items:
+      if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+      if cached.get('modified'):
+        headers['If-Modified-Since'] = cached['modified']
+
+    response = self.request(rss_url, headers=headers, accept=(304,))
+    if response.status == 304:
+      if self.debug:
+        print 'News feed not modified since the last run.'
+      return [tuple(entry) for entry in cached['entries'][:items]]
+
+    entries = self._parse(response.body, items)
+    store.save(name, {
+      'etag': response.getheader('etag'),
+      'modified': response.getheader('last-modified'),
+      'entries': entries,
+    })
+    return entries
+
+  # Parse RSS (or Atom) items until we have enough of them
+  def _parse(self, body, items):
+    entries = []
+    for event, element in cElementTree.iterparse(StringIO(body)):
+      tag = element.tag.rsplit('}', 1)[-1]
+      if tag not in ('item', 'entry'):
+        continue
+      fields = {}
+      for child in element:
+        fields[child.tag.rsplit('}', 1)[-1]] = self._text(child)
+      entries.append((fields.get('title', ''),
+                      fields.get('description', fields.get('summary', ''))))
+      element.clear()
+      if len(entries) >= items:
+        break
+    return entries
+
+  # Text of an element without any markup it may carry
+  def _text(self, element):
+    text = ''.join(element.itertext())
+    return ' '.join(re.sub(r'<[^>]*>', ' ', text).split())
@@ -1,78 +1,116 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import urllib2
-import json
+from multiprocessing.pool import ThreadPool
 import decimal
+import re
 import better_spoken_numbers as bsn
-from pprint import pprint
-from math import floor
 
 from apcontent import alarmpi_content
 
 #print int(time.strftime("%m%d"))
 
+# Bits of company names that aren't worth saying
+NAMEJUNK = re.compile(r'Common Stock| Inc|[,.]|\(NS\) O')
+
 class stocks(alarmpi_content):
   def build(self):
-    tickers=self.sconfig['tickers'].split(',')
+    tickers=[t.strip() for t in self.sconfig['tickers'].split(',') if t.strip()]
 
-    stocks='Stock update: '
-    stocks_display='markets: '
+    # The query takes a list of symbols, so ask for all of them at once.
+    # If that doesn't work, ask for each of them at the same time.
+    quotes = None
+    if self.sconfig.get('batch', '1') == str(1) and len(tickers) > 1:
+      try:
+        quotes = self._fetch(tickers)
+      except Exception as e:
+        if self.debug:
+          print 'Batched quote request failed: ' + str(e)
+    if quotes is None:
+      quotes = self._fetch_each(tickers)
 
-    for ticker in tickers:
-      try: 
-        apiurl = 'https://' + \
-                 self.sconfig['host'] + \
-                 self.sconfig['path'] + \
-                 ticker + \
-                 self.sconfig['pathtail']
-        #api = urllib2.urlopen('https://query.yahooapis.com/v1/public/yql?q=select%20*%20from%20yahoo.finance.quote%20where%20symbol%20in%20(%27'+ticker+'%27)%20&format=json&env=store://datatables.org/alltableswithkeys', timeout=4)
-        api = urllib2.urlopen(apiurl, timeout=4)
-        response = api.read()
-        response_dictionary = json.loads(response)
-
-        #print response_dictionary
-        stock_name = response_dictionary['query']['results']['quote']['Name'].replace("Common Stock", '').replace(' Inc','').replace(',','').replace('.','').replace('(NS) O','')
-        symbol = response_dictionary['query']['results']['quote']['symbol']
-        
-        # get the price
-        stock_price = response_dictionary['query']['results']['quote']['LastTradePriceOnly']
-        # trim it to something sane
-        stock_price = round(decimal.Decimal(stock_price),2)
-
-        #find the change
-        stock_change = response_dictionary['query']['results']['quote']['Change']
-        # trim it to something sane
-        stock_change = round(decimal.Decimal(stock_change),2)
-        stock_change = str(stock_change)
-        stock_change = stock_change.replace("-",'▼').replace("+",'▲').strip()
-    #    print stock_change
-
-
-        #other stuff in case I ever want it
-        stock_high = response_dictionary['query']['results']['quote']['DaysHigh']
-        stock_high = round(decimal.Decimal(stock_high),2)
-        stock_low = response_dictionary['query']['results']['quote']['DaysLow']
-        stock_low = round(decimal.Decimal(stock_low),2)
-        market_cap = response_dictionary['query']['results']['quote']['MarketCapitalization']
-
-        whole_price = floor(stock_price)
-        decimal_price = floor((stock_price - whole_price)*100)
-        stock_price_spoken = bsn.n2w(int(whole_price)) + ' dollars'
-        if decimal_price > 0:
-          stock_price_spoken += ' and ' + bsn.n2w(int(decimal_price)) + ' cents'
-        
-        stocks += stock_name + ' is trading at ' + stock_price_spoken + '.  '
-        stocks_display += str(symbol) + ' ' + str(stock_price) + str(stock_change) + ', '
+    results = [self._parse(ticker, quotes.get(ticker.lower())) for ticker in tickers]
+    self.content, self.display = self._render(results)
 
+    if self.debug:
+      print self.content
+      print self.display
+
+  # url for a list of tickers
+  def _url(self, tickers):
+    return self.sconfig.get('scheme', 'https') + '://' + \
+           self.sconfig['host'] + \
+           self.sconfig['path'] + \
+           '%27,%27'.join(tickers) + \
+           self.sconfig['pathtail']
 
+  # Returns {lower case symbol: quote} for the quotes in one response
+  def _fetch(self, tickers):
+    response_dictionary = self.fetchjson(self._url(tickers))
+    quotes = response_dictionary['query']['results']['quote']
+    if isinstance(quotes, dict): # Only one quote comes back on its own
+      quotes = [quotes]
+    return dict((str(quote['symbol']).lower(), quote) for quote in quotes)
+
+  def _fetch_each(self, tickers):
+    def fetch(ticker):
+      try:
+        return self._fetch([ticker])
       except Exception:
         if self.debug:
           print ticker + ' Failed.'
-        stocks = 'Failed to connect to Yahoo Finance.  '
+        return {}
+    pool = ThreadPool(max(min(len(tickers), 8), 1))
+    try:
+      quotes = {}
+      for found in pool.map(fetch, tickers):
+        quotes.update(found)
+      return quotes
+    finally:
+      pool.close()
 
-    if self.debug:
-      print stocks
-      print stocks_display
+  # One parsed result: a dict with the symbol and either the quote or the
+  # reason we couldn't get it
+  def _parse(self, ticker, quote):
+    result = {'symbol': ticker, 'error': None}
+    try:
+      if quote is None:
+        raise KeyError('no quote returned')
+      result['symbol'] = quote['symbol']
+      result['name'] = NAMEJUNK.sub('', quote['Name'])
+
+      # get the price, trimmed to something sane
+      result['price'] = round(decimal.Decimal(quote['LastTradePriceOnly']),2)
+
+      #find the change
+      stock_change = str(round(decimal.Decimal(quote['Change']),2))
+      result['change'] = stock_change.replace("-",'▼').replace("+",'▲').strip()
+
+      #other stuff in case I ever want it
+      #quote['DaysHigh'] quote['DaysLow'] quote['MarketCapitalization']
+    except Exception as e:
+      if self.debug:
+        print ticker + ' Failed: ' + repr(e)
+      result['error'] = e
+    return result
+
+  # The spoken and the displayed versions of the results
+  def _render(self, results):
+    stocks='Stock update: '
+    stocks_display='markets: '
+    failed = [r['symbol'] for r in results if r['error'] is not None]
+
+    if len(failed) == len(results):
+      self.failed = True
+      return 'Failed to connect to Yahoo Finance.  ', stocks_display
+
+    quoted = [r for r in results if r['error'] is None]
+    spoken = bsn.batch([r['price'] for r in quoted], bsn.currency)
+    for result, stock_price_spoken in zip(quoted, spoken):
+      stocks += result['name'] + ' is trading at ' + stock_price_spoken + '.  '
+      stocks_display += str(result['symbol']) + ' ' + str(result['price']) + result['change'] + ', '
 
-    self.content = stocks
+    if failed:
+      stocks += 'No quote for ' + ', '.join(str(s) for s in failed) + '.  '
+      stocks_display += ', '.join(str(s) + ' n/a' for s in failed)
+    return stocks, stocks_display
@@ -12,7 +12,7 @@ class textfile(alarmpi_content):
       with open(self.sconfig['filepath'], 'r') as myfile:
         textfile=myfile.read().replace('\n', '  ')
     except IOError:
-      pass
+      self.failed = True
 
     if self.debug:
       print textfile
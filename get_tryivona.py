@@ -1,44 +1,51 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import pyvona
-import pygame
-import subprocess
-import utilities
+import StringIO
+import threading
 
+import applayer
 from aptts import alarmpi_tts
 
 class tryivona(alarmpi_tts):
-  def play(self, content, ramdrive='/mnt/ram/'):
+  def __init__(self, stype, sconfig, debug, main):
+    alarmpi_tts.__init__(self, stype, sconfig, debug, main)
+    self.ivona = None
+    self.lock = threading.Lock()
+
+  def stream(self, ramdrive=None):
     if self.debug:
       print "Trying Ivona."
-    rval = True
+    return alarmpi_tts.stream(self, ramdrive)
+
+  def voice(self):
+    return self.sconfig['ivona_voice'] + ':' + self.sconfig['ivona_speed']
+
+  # Speech comes back over the network; keep it in memory
+  streams = True
+
+  def render_data(self, text):
     try:
-      #Connect to Ivona
-      v = pyvona.create_voice(self.sconfig['ivona_accesskey'],
-                              self.sconfig['ivona_secretkey'])
-      #Settings for ivona
-      v.voice_name = self.sconfig['ivona_voice']
-      v.speech_rate = self.sconfig['ivona_speed']
       #Get ogg file with speech
-      content = utilities.stripSymbols(content) # Removes symbols before sending to Ivona
-      v.fetch_voice(content, ramdrive + 'tempspeech.ogg')
-      
-      # Play the oggs returned
-      pygame.mixer.init()
-      pygame.mixer.music.load(ramdrive + "tempspeech.ogg")
-      pygame.mixer.music.play()
-      while pygame.mixer.music.get_busy() == True:
-        continue
-        
+      fp = StringIO.StringIO()
+      self._ivona().fetch_voice_fp(text, fp)
     except pyvona.PyvonaException:
-      rval = False
-
-    except subprocess.CalledProcessError:
-      rval = False
-      
-    # Cleanup any ogg files created in this directory.
-    print 'cleaning up now'
-    rmcmd = 'rm -f ' + ramdrive + '*' + self.sconfig['tail']
-    print subprocess.call (rmcmd, shell=True)
-  
-    return rval
+      return None
+    return fp.getvalue()
+
+  # One connection to Ivona for all of our pieces, made when first needed
+  def _ivona(self):
+    with self.lock:
+      if self.ivona is None:
+        #Connect to Ivona
+        v = pyvona.create_voice(self.sconfig['ivona_accesskey'],
+                                self.sconfig['ivona_secretkey'])
+        #Settings for ivona
+        v.voice_name = self.sconfig['ivona_voice']
+        v.speech_rate = self.sconfig['ivona_speed']
+        self.ivona = v
+      return self.ivona
+
+  # Oggs are played through pygame unless a player is configured
+  def player(self):
+    return applayer.player(self.sconfig.get('player', 'pygame'), self.debug)
@@ -2,44 +2,32 @@
 # -*- coding: utf-8 -*-
 import os.path
 import subprocess
-import uuid
 
 from aptts import alarmpi_tts
 
 class trypico2wave(alarmpi_tts):
-  def play(self, content, ramdrive='/mnt/ram/'):
+  def stream(self, ramdrive=None):
     if self.debug:
       print "Trying pico2wave."
-    rval = True
+    return alarmpi_tts.stream(self, ramdrive)
+
+  def voice(self):
+    return self.sconfig['lang']
+
+  def render(self, text, fn):
     p2w = self.sconfig['head']
     lang =self.sconfig['lang']
     if not os.path.isfile(p2w): # The executable does not exist
       if self.debug:
         print 'File ' + p2w + ' does not exist.'
       return False
-    try:
-      tmfn = ramdrive + str(uuid.uuid4()) + self.sconfig['tail']
-      cmd = p2w + ' -l ' + lang + ' -w ' + tmfn + ' "' + content + '"'
-      if self.debug:
-        print cmd
-      print subprocess.call(cmd, shell=True)
-      cmd = self.sconfig['player'] + ' ' + tmfn
-      if self.debug:
-        print cmd
-      print subprocess.call(cmd, shell=True)
-      cmd = 'rm -f ' + tmfn
-      if self.debug:
-        print cmd
-      print subprocess.call(cmd, shell=True)
-    except subprocess.CalledProcessError:
-      rval = False
-      
-    # Cleanup any ogg files created in this directory.
-    if self.debug:
-      print 'cleaning up now'
-    rmcmd = 'rm -f ' + ramdrive + '*' + self.sconfig['tail']
+    # Straight to pico2wave, not through a shell, which would expand $(...)
+    # and the like in the text we were sent
+    args = [p2w, '-l', lang, '-w', fn, text]
     if self.debug:
-       print rmcmd
-    print subprocess.call (rmcmd, shell=True)
-  
-    return rval
+      print ' '.join(args)
+    try:
+      return subprocess.call(args) == 0
+    except OSError as e:
+      print 'Could not start ' + p2w + ': ' + str(e)
+      return False
@@ -1,10 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import urllib
-import urllib2
-import json
-import decimal
 import time
 
 from apcontent import alarmpi_content
@@ -19,15 +15,13 @@ class weather_yahoo(alarmpi_content):
         metric = ''
 
     try:
-        weather_url = "https://" + \
+        weather_url = self.sconfig.get('scheme', 'https') + '://' + \
                       self.sconfig["host"] + \
                       self.sconfig["path"] + \
                       location + \
                       metric + \
                       self.sconfig['pathtail']
-        weather_api = urllib.urlopen(weather_url)
-        response = weather_api.read()
-        response_dictionary = json.loads(response)
+        response_dictionary = self.fetchjson(weather_url)
 
         current = response_dictionary['query']['results']['channel']['item']['condition']['temp']
         current_low = response_dictionary['query']['results']['channel']['item']['forecast'][0]['low']
@@ -98,6 +92,7 @@ class weather_yahoo(alarmpi_content):
 
     except Exception:
       weather_yahoo = 'Failed to connect to Yahoo Weather.  '
+      self.failed = True
 
     if self.debug:
       print weather_yahoo
@@ -1,35 +1,20 @@
 #!/usr/bin/python
-
-# Import required Python libraries
-import RPi.GPIO as GPIO
-import time
-
-# Use BCM GPIO references instead of physical pin numbers
-GPIO.setmode(GPIO.BCM)
-
-# init list with pin numbers
-
-pinList = [15]
-
-# loop through pins and set mode and state to 'low'
-
-for i in pinList: 
-    GPIO.setwarnings(False)
-    GPIO.setup(i, GPIO.OUT) 
-    GPIO.output(i, GPIO.HIGH)
-
-def trigger() :
-        for i in pinList:
-          GPIO.output(i, GPIO.HIGH)
-#         GPIO.cleanup()
-          break
-     
-
-try: 
-    trigger()
-         
-      
-except KeyboardInterrupt:
-  print "  Quit" 
-  # Reset GPIO settings
-  GPIO.cleanup()
\ No newline at end of file
+# Turns the light on: through alarm_daemon.py if it is running, which owns
+# the pins, or else by driving them from here
+import ConfigParser
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+import aplight
+
+Config=ConfigParser.ConfigParser()
+Config.read(os.path.join(here, 'alarm.config'))
+section = dict(Config.items('light')) if Config.has_section('light') else {}
+main = dict(Config.items('main')) if Config.has_section('main') else {}
+
+# statefldr is relative to the alarm's folder, like everything in the config
+socket = os.path.join(here, aplight.socketpath(section, main))
+if not aplight.send('on', socket):
+  aplight.light(section).on()
@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import ConfigParser
 import subprocess
 
-Config=ConfigParser.ConfigParser()
-try:
-  Config.read('alarm.config')
-except:
-  raise Exception('Sorry, Failed reading alarm.config file.')
+import aplibrary
 
-subprocess.call('find '+ Config.get('main','musicfldr') + ' -name \'*.mp3\' | sort --random-sort| mpg123 -@ - -l 1 -g 60', shell=True)
\ No newline at end of file
+# Shuffle the whole music index instead of walking the whole library
+library = aplibrary.alarmpi_library.for_scripts()
+player = subprocess.Popen(['mpg123', '-@', '-', '-l', '1', '-g', '60'],
+                          stdin=subprocess.PIPE)
+player.communicate('\n'.join(library.pick()) + '\n')
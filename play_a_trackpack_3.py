@@ -4,6 +4,8 @@ import ConfigParser
 import subprocess
 import time
 
+import aplibrary
+
 Config=ConfigParser.ConfigParser()
 try:
   Config.read('alarm.config')
@@ -13,7 +15,11 @@ except:
 if Config.get('main','light') == str(1):
   print subprocess.call ('python lighton_1.py', shell=True)
 
-subprocess.call('find '+ Config.get('main','musicfldr') + ' -name \'*.mp3\' | sort --random-sort| head -n 3| xargs -d \'\n\' mpg123', shell=True)
+# Pick the songs from the music index instead of walking the whole library
+library = aplibrary.alarmpi_library.for_scripts()
+tracks = library.pick(3)
+if tracks:
+  subprocess.call(['mpg123'] + tracks)
 
 if Config.get('main','light') == str(1):
   time.sleep(int(Config.get('main','lightdelay')));
@@ -6,13 +6,62 @@
 
 
 <?php
+// Where the alarm is installed
+$alarmpi = "/home/pi/alarmpi";
+// alarm_daemon.py owns the light and takes commands on this socket
+// (light.sock in statefldr, or 'socket' in the [light] section)
+$lightsocket = "unix://$alarmpi/state/light.sock";
+
+// Send a command to alarm_daemon.py.  Returns its answer, or false if it
+// isn't running.
+function light($command)
+{
+global $lightsocket;
+$client = @stream_socket_client($lightsocket, $errno, $errstr, 2);
+if (!$client)
+{
+return false;
+}
+fwrite($client, $command . "\n");
+$answer = trim(fgets($client));
+fclose($client);
+return $answer == "ok" ? "" : $answer;
+}
+
+// Without alarm_daemon.py (alarms run from cron), drive the pins with the
+// helper scripts, as root like before
+function helper($script)
+{
+global $alarmpi;
+exec("sudo python $alarmpi/$script", $output, $status);
+return $status == 0 ? "" : "$script failed";
+}
+
+$message = "";
 if (isset($_POST['LightON']))
 {
-exec("sudo python /home/pi/lighton_1.py");
+$message = light("on");
+if ($message === false)
+{
+$message = helper("lighton_1.py");
+}
 }
 if (isset($_POST['LightOFF']))
 {
-exec("sudo python /home/pi/lightoff_1.py");
+$message = light("off");
+if ($message === false)
+{
+$message = helper("lightoff_1.py");
+}
+}
+if (isset($_POST['Sunrise']))
+{
+// A sunrise takes minutes, so only a process that stays up can do it
+$message = light("ramp 600");
+if ($message === false)
+{
+$message = "Sunrise needs alarm_daemon.py running";
+}
 }
 if (isset($_POST['PlaySong']))
 {
@@ -22,10 +71,12 @@ system("find /media/4tb/music/singles -name '*.mp3' | sort --random-sort| mpg123
 
 <form method="post">
 <button class="btn" name="LightON">Light ON</button>&nbsp;
-<button class="btn" name="LightOFF">Light OFF</button><br><br>
+<button class="btn" name="LightOFF">Light OFF</button>&nbsp;
+<button class="btn" name="Sunrise">Sunrise</button><br><br>
 <!-- <button class="btn" name="PlaySong">Play a random track</button><br>
 -->
 </form> 
+<?php if ($message) echo "<p>" . htmlspecialchars($message) . "</p>"; ?>
 
 
 </html>